@@ -1,19 +1,63 @@
 import sqlite3
+import asyncio
+import contextvars
+import csv
 import datetime
+import io
+import functools
+import json
+import re
+import uuid
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import psycopg2
 import psycopg2.extras 
 import os 
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash
+from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, g, has_app_context, session, Response, stream_with_context, make_response
 import calendar 
-import locale 
 import click 
+import numpy as np
 from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user, login_required
 from flask_bcrypt import Bcrypt
+from flask import before_render_template, template_rendered
+try:
+    import redis
+except ImportError:
+    redis = None
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'mi-llave-secreta-muy-segura-12345'
 DATABASE_URL = os.environ.get('DATABASE_URL')
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'gastos.db')
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+CACHE_URL = os.environ.get('CACHE_URL')
+CACHE_TTL = int(os.environ.get('CACHE_TTL', 300))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 1024))
+USER_SESSION_TTL = int(os.environ.get('USER_SESSION_TTL', 300))
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+PAGE_CACHE_ENABLED = os.environ.get('PAGE_CACHE_ENABLED', '1') == '1'
+PAGE_CACHE_MAX_ENTRIES = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 256))
+TRANSACCIONES_POR_PAGINA = int(os.environ.get('TRANSACCIONES_POR_PAGINA', 50))
+TRANSACCIONES_POR_PAGINA_MAX = 200
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 2000))
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 5000))
+RECURRING_BATCH_SIZE = int(os.environ.get('RECURRING_BATCH_SIZE', 1000))
+TRANSACCIONES_PARTICION = os.environ.get('TRANSACCIONES_PARTICION', 'mensual')
+PARTICIONES_ADELANTE = int(os.environ.get('PARTICIONES_ADELANTE', 3))
+UMBRALES_PRESUPUESTO = tuple(int(u) for u in os.environ.get('BUDGET_THRESHOLDS', '80,100').split(','))
+ASYNC_CHART_WORKERS = int(os.environ.get('ASYNC_CHART_WORKERS', DB_POOL_MAX))
+BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+HASH_WORKERS = int(os.environ.get('HASH_WORKERS', 2))
+HASH_QUEUE_MAX = int(os.environ.get('HASH_QUEUE_MAX', 16))
+HASH_RETRY_AFTER = int(os.environ.get('HASH_RETRY_AFTER', 2))
 
+app.config['BCRYPT_LOG_ROUNDS'] = BCRYPT_LOG_ROUNDS
 bcrypt = Bcrypt(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login' 
@@ -25,27 +69,40 @@ class User(UserMixin):
         self.id = id
         self.email = email
 
+def recordar_usuario_en_sesion(user):
+    # La sesión de Flask va firmada, así que el id/email guardados no se pueden
+    # alterar desde el cliente; se vuelven a verificar contra la BD cada USER_SESSION_TTL.
+    session['usuario'] = {'id': user.id, 'email': user.email, 'verificado': time.time()}
+
+def olvidar_usuario_en_sesion():
+    session.pop('usuario', None)
+
 @login_manager.user_loader
 def load_user(user_id):
+    datos = session.get('usuario')
+    if datos and str(datos.get('id')) == str(user_id) and time.time() - datos.get('verificado', 0) < USER_SESSION_TTL:
+        return User(id=datos['id'], email=datos['email'])
+
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
+    cursor.execute("SELECT id, email FROM users WHERE id = %s", (user_id,))
     user_db = cursor.fetchone()
     conn.close()
     if user_db:
-        return User(id=user_db['id'], email=user_db['email'])
+        user = User(id=user_db['id'], email=user_db['email'])
+        recordar_usuario_en_sesion(user)
+        return user
+    olvidar_usuario_en_sesion()
     return None
 
 @app.context_processor
 def inject_global_vars():
     categorias = []
-    if current_user.is_authenticated:
+    if current_user.is_authenticated and 'categorias_usuario' in g:
+        categorias = g.categorias_usuario
+    elif current_user.is_authenticated:
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT nombre FROM categorias WHERE user_id = %s ORDER BY nombre ASC", (current_user.id,))
-            categorias = [row['nombre'] for row in cursor.fetchall()]
-            conn.close()
+            categorias = get_categorias_usuario(current_user.id)
         except Exception as e:
             print(f"ADVERTENCIA: No se pudieron cargar las categorías. Error: {e}")
             
@@ -53,41 +110,943 @@ def inject_global_vars():
         categorias_globales=categorias
     )
 
+# Nombres de meses y formato de moneda fijos en español, sin pasar por locale:
+# locale.setlocale cambia estado global del proceso y no es seguro entre hilos.
+NOMBRES_MESES = ('Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre')
+NOMBRES_MESES_CORTOS = tuple(nombre[:3] for nombre in NOMBRES_MESES)
+Mes = namedtuple('Mes', 'val nom')
+MESES_DEL_ANO = tuple(Mes(f"{i:02d}", nombre) for i, nombre in enumerate(NOMBRES_MESES, 1))
+
+@functools.lru_cache(maxsize=4)
+def anos_disponibles(ano_actual):
+    return tuple(range(ano_actual - 5, ano_actual + 2))
+
 @app.template_filter('currency')
 def format_currency_filter(value):
+    # Se agrupa con '_' (nunca depende del locale) y se cambia por '.' con un replace.
     try:
-        formatted_value = f"${int(value):,d}"
-        return formatted_value.replace(",", ".")
+        return f"${int(value):_d}".replace("_", ".")
     except (ValueError, TypeError):
         try:
-            formatted_value = f"${value:,.0f}"
-            return formatted_value.replace(",", ".")
+            return f"${value:_.0f}".replace("_", ".")
         except Exception:
             return value
 
-def set_locale():
-    try:
-        locales_to_try = ['es_ES.UTF-8', 'es_ES', 'spanish', 'es-CL.UTF-8', 'es-CL']
-        for loc in locales_to_try:
-            try:
-                locale.setlocale(locale.LC_TIME, loc)
-                return True
-            except locale.Error:
-                continue
-    except Exception:
-        pass
-    return False
+# --- Conexiones a la Base de Datos ---
+class PoolAgotadoError(Exception):
+    """No se liberó ninguna conexión del pool dentro de DB_POOL_TIMEOUT."""
 
-def get_db_connection():
-    if DATABASE_URL:
-        conn = psycopg2.connect(DATABASE_URL)
+
+class ConnectionPool:
+    """Pool thread-safe de conexiones psycopg2.
+
+    A diferencia de psycopg2.pool.ThreadedConnectionPool, cuando el pool está
+    lleno se espera (hasta `timeout` segundos) a que otra petición devuelva su
+    conexión, y se lleva la cuenta del tiempo de espera para poder dimensionarlo.
+    """
+
+    def __init__(self, dsn, minconn, maxconn, timeout):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._idle = []
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        for _ in range(minconn):
+            self._idle.append(self._connect())
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
         conn.cursor_factory = psycopg2.extras.DictCursor
         return conn
-    else:
-        conn = sqlite3.connect('gastos.db')
-        conn.row_factory = sqlite3.Row
+
+    def getconn(self):
+        inicio = time.perf_counter()
+        limite = inicio + self.timeout
+        espero = False
+        with self._cond:
+            while not self._idle and self._in_use >= self.maxconn:
+                restante = limite - time.perf_counter()
+                if restante <= 0:
+                    self._timeouts += 1
+                    raise PoolAgotadoError(f"Sin conexiones libres tras {self.timeout}s (máximo {self.maxconn}).")
+                espero = True
+                self._cond.wait(restante)
+            conn = self._idle.pop() if self._idle else None
+            self._in_use += 1
+            self._checkouts += 1
+            if espero:
+                espera = time.perf_counter() - inicio
+                self._waits += 1
+                self._wait_total += espera
+                self._wait_max = max(self._wait_max, espera)
+        try:
+            if conn is None or conn.closed:
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def putconn(self, conn):
+        descartar = bool(conn.closed)
+        if not descartar:
+            try:
+                conn.rollback()
+            except Exception:
+                descartar = True
+        if descartar:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        with self._cond:
+            self._in_use -= 1
+            if not descartar:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'backend': 'postgres',
+                'min_size': self.minconn,
+                'max_size': self.maxconn,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'wait_time_total_ms': round(self._wait_total * 1000, 2),
+                'wait_time_max_ms': round(self._wait_max * 1000, 2),
+                'timeouts': self._timeouts,
+            }
+
+
+class SQLiteCursor(sqlite3.Cursor):
+    """Cursor que acepta los placeholders '%s' de psycopg2 para compartir el SQL."""
+
+    def execute(self, sql, params=()):
+        return super().execute(sql.replace('%s', '?'), params)
+
+    def executemany(self, sql, seq_params):
+        return super().executemany(sql.replace('%s', '?'), seq_params)
+
+
+class SQLiteConnection(sqlite3.Connection):
+    def cursor(self, factory=SQLiteCursor):
+        return super().cursor(factory)
+
+
+class SQLiteThreadConnections:
+    """Una conexión SQLite reutilizada por hilo (sqlite3 no comparte conexiones entre hilos)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._in_use = 0
+        self._checkouts = 0
+
+    def getconn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, factory=SQLiteConnection)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            with self._lock:
+                self._opened += 1
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+        return conn
+
+    def putconn(self, conn):
+        try:
+            conn.rollback()
+        finally:
+            with self._lock:
+                self._in_use -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'sqlite',
+                'in_use': self._in_use,
+                'idle': self._opened - self._in_use,
+                'checkouts': self._checkouts,
+                'waits': 0,
+                'wait_time_total_ms': 0.0,
+                'wait_time_max_ms': 0.0,
+                'timeouts': 0,
+            }
+
+
+class ConexionPrestada:
+    """Conexión tomada del pool.
+
+    Si está ligada al contexto de Flask, close() sólo descarta la transacción
+    pendiente (como hacía cerrar una conexión nueva) y la conexión vuelve al
+    pool en el teardown. Fuera de un contexto, close() la devuelve al pool.
+    """
+
+    def __init__(self, conn, pool, ligada_al_contexto):
+        self._conn = conn
+        self._pool = pool
+        self._ligada = ligada_al_contexto
+
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
+
+    def cursor(self, *args, **kwargs):
+        return CursorInstrumentado(self._conn.cursor(*args, **kwargs))
+
+    def close(self):
+        if self._conn is None:
+            return
+        if self._ligada:
+            try:
+                self._conn.rollback()
+            except Exception:
+                pass
+        else:
+            self.devolver()
+
+    def devolver(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.putconn(conn)
+
+
+# --- Instrumentación ---
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_HUELLAS_SQL = 500
+
+def huella_sql(sql):
+    """Normaliza una consulta para agrupar sus ejecuciones sin importar los valores."""
+    if isinstance(sql, bytes):
+        # execute_values/execute_batch de psycopg2 mandan el SQL ya armado como bytes.
+        sql = sql.decode('utf-8', 'replace')
+    elif not isinstance(sql, str):
+        sql = str(sql)
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"(%s|\?)(\s*,\s*(%s|\?))+", "?, ...", sql)
+    # Las sentencias multi-fila (VALUES (...), (...)) comparten huella sea cual sea el tamaño del lote.
+    sql = re.sub(r"(\([^()]*\))(\s*,\s*\1)+", r"\1, ...", sql)
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+class Metricas:
+    """Contadores en memoria del proceso que se exponen en /metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.peticiones = {}
+        self.latencias = {}
+        self.consultas = {}
+        self.hashes = {}
+        self.hashes_rechazados = 0
+
+    def registrar_peticion(self, endpoint, metodo, estado, total, db, render, n_consultas):
+        with self._lock:
+            clave = (endpoint, metodo, str(estado))
+            self.peticiones[clave] = self.peticiones.get(clave, 0) + 1
+            hist = self.latencias.setdefault(endpoint, {
+                'buckets': [0] * len(BUCKETS_LATENCIA), 'count': 0, 'sum': 0.0,
+                'db': 0.0, 'render': 0.0, 'consultas': 0,
+            })
+            for i, limite in enumerate(BUCKETS_LATENCIA):
+                if total <= limite:
+                    hist['buckets'][i] += 1
+            hist['count'] += 1
+            hist['sum'] += total
+            hist['db'] += db
+            hist['render'] += render
+            hist['consultas'] += n_consultas
+
+    def registrar_consulta(self, huella, segundos):
+        with self._lock:
+            actual = self.consultas.get(huella)
+            if actual is None:
+                if len(self.consultas) >= MAX_HUELLAS_SQL:
+                    huella = 'otras'
+                actual = self.consultas.setdefault(huella, [0, 0.0])
+            actual[0] += 1
+            actual[1] += segundos
+
+    def registrar_hash(self, operacion, segundos):
+        with self._lock:
+            if segundos is None:
+                self.hashes_rechazados += 1
+                return
+            hist = self.hashes.setdefault(operacion, {'buckets': [0] * len(BUCKETS_LATENCIA), 'count': 0, 'sum': 0.0})
+            for i, limite in enumerate(BUCKETS_LATENCIA):
+                if segundos <= limite:
+                    hist['buckets'][i] += 1
+            hist['count'] += 1
+            hist['sum'] += segundos
+
+metricas = Metricas()
+
+def registrar_consulta(sql, segundos):
+    if has_app_context():
+        g.db_tiempo = g.get('db_tiempo', 0.0) + segundos
+        g.db_consultas = g.get('db_consultas', 0) + 1
+    huella = huella_sql(sql)
+    metricas.registrar_consulta(huella, segundos)
+    if segundos * 1000 >= SLOW_QUERY_MS:
+        app.logger.warning("Consulta lenta (%.1f ms): %s", segundos * 1000, huella)
+
+
+class CursorInstrumentado:
+    """Envuelve un cursor de psycopg2/sqlite3 y mide cada consulta que ejecuta."""
+
+    def __init__(self, cursor):
+        object.__setattr__(self, '_cursor', cursor)
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+    def __setattr__(self, nombre, valor):
+        setattr(self._cursor, nombre, valor)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def _medir(self, metodo, sql, *args):
+        inicio = time.perf_counter()
+        try:
+            return metodo(sql, *args)
+        finally:
+            registrar_consulta(sql, time.perf_counter() - inicio)
+
+    def execute(self, sql, *args):
+        return self._medir(self._cursor.execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return self._medir(self._cursor.executemany, sql, *args)
+
+    def copy_expert(self, sql, *args):
+        return self._medir(self._cursor.copy_expert, sql, *args)
+
+
+@app.before_request
+def iniciar_medicion():
+    g.inicio_peticion = time.perf_counter()
+    g.db_tiempo = 0.0
+    g.db_consultas = 0
+    g.render_tiempo = 0.0
+
+def _inicio_render(sender, template, context, **extra):
+    g.inicio_render = time.perf_counter()
+
+def _fin_render(sender, template, context, **extra):
+    if 'inicio_render' in g:
+        g.render_tiempo = g.get('render_tiempo', 0.0) + time.perf_counter() - g.pop('inicio_render')
+
+before_render_template.connect(_inicio_render, app)
+template_rendered.connect(_fin_render, app)
+
+@app.after_request
+def registrar_medicion(response):
+    if 'inicio_peticion' not in g:
+        return response
+    total = time.perf_counter() - g.inicio_peticion
+    db, render, n_consultas = g.get('db_tiempo', 0.0), g.get('render_tiempo', 0.0), g.get('db_consultas', 0)
+    response.headers['Server-Timing'] = (
+        f'db;dur={db * 1000:.1f};desc="{n_consultas} consultas", '
+        f'render;dur={render * 1000:.1f}, total;dur={total * 1000:.1f}'
+    )
+    metricas.registrar_peticion(request.endpoint or 'desconocido', request.method, response.status_code,
+                                total, db, render, n_consultas)
+    return response
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    # El pool se crea perezosamente y por proceso: los workers de gunicorn no
+    # deben heredar sockets abiertos por el master.
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                if DATABASE_URL:
+                    _pool = ConnectionPool(DATABASE_URL, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT)
+                else:
+                    _pool = SQLiteThreadConnections(SQLITE_PATH)
+                _pool_pid = os.getpid()
+    return _pool
+
+def get_db_connection():
+    # Dentro de una petición todos (load_user, context processors y la vista)
+    # comparten la misma conexión; se devuelve al pool en el teardown.
+    pool = get_pool()
+    if has_app_context():
+        if 'db' not in g:
+            g.db = ConexionPrestada(pool.getconn(), pool, ligada_al_contexto=True)
+        return g.db
+    return ConexionPrestada(pool.getconn(), pool, ligada_al_contexto=False)
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    conn = g.pop('db', None)
+    if conn is not None:
+        conn.devolver()
+
+# --- Caché de datos por usuario ---
+class MemoryCache:
+    """LRU en memoria del proceso con expiración por entrada."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            expira, valor = entrada
+            if expira < time.monotonic():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return valor
+
+    def set(self, clave, valor, ttl=None):
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + (ttl or self.ttl), valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entries:
+                self._datos.popitem(last=False)
+
+    def delete(self, *claves):
+        with self._lock:
+            for clave in claves:
+                self._datos.pop(clave, None)
+
+    def __len__(self):
+        return len(self._datos)
+
+
+class PageCache(MemoryCache):
+    """Páginas ya renderizadas, con la cuenta del tiempo de render que se ahorra en cada acierto."""
+
+    def __init__(self, max_entries, ttl):
+        super().__init__(max_entries, ttl)
+        self.hits = 0
+        self.misses = 0
+        self.render_ms_saved = 0.0
+
+    def get_pagina(self, clave):
+        entrada = self.get(clave)
+        with self._lock:
+            if entrada is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.render_ms_saved += entrada[1]
+        return entrada
+
+    def delete_usuario(self, user_id):
+        with self._lock:
+            for clave in [clave for clave in self._datos if clave[0] == user_id]:
+                del self._datos[clave]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': PAGE_CACHE_ENABLED,
+                'entries': len(self._datos),
+                'hits': self.hits,
+                'misses': self.misses,
+                'render_ms_saved': round(self.render_ms_saved, 2),
+            }
+
+
+class SQLiteCache:
+    """Caché compartida entre los workers de una misma máquina a través de un archivo SQLite."""
+
+    def __init__(self, path, max_entries, ttl):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS cache (clave TEXT PRIMARY KEY, valor TEXT NOT NULL, expira REAL NOT NULL, usado REAL NOT NULL)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
         return conn
 
+    def get(self, clave):
+        conn = self._conn()
+        fila = conn.execute("SELECT valor, expira FROM cache WHERE clave = ?", (clave,)).fetchone()
+        if fila is None:
+            return None
+        ahora = time.time()
+        if fila[1] < ahora:
+            conn.execute("DELETE FROM cache WHERE clave = ?", (clave,))
+            return None
+        conn.execute("UPDATE cache SET usado = ? WHERE clave = ?", (ahora, clave))
+        return json.loads(fila[0])
+
+    def set(self, clave, valor, ttl=None):
+        conn = self._conn()
+        ahora = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (clave, valor, expira, usado) VALUES (?, ?, ?, ?)",
+            (clave, json.dumps(valor), ahora + (ttl or self.ttl), ahora)
+        )
+        conn.execute(
+            "DELETE FROM cache WHERE clave IN (SELECT clave FROM cache ORDER BY usado "
+            "LIMIT MAX(0, (SELECT COUNT(*) FROM cache) - ?))",
+            (self.max_entries,)
+        )
+
+    def delete(self, *claves):
+        self._conn().executemany("DELETE FROM cache WHERE clave = ?", [(clave,) for clave in claves])
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class RedisCache:
+    """Caché compartida en un Redis (o compatible) local; Redis se encarga de expirar y desalojar."""
+
+    def __init__(self, url, ttl):
+        if redis is None:
+            raise RuntimeError("CACHE_BACKEND=redis requiere el paquete 'redis'.")
+        self.ttl = ttl
+        self._cliente = redis.Redis.from_url(url or 'redis://localhost:6379/0')
+
+    def get(self, clave):
+        valor = self._cliente.get(clave)
+        return None if valor is None else json.loads(valor)
+
+    def set(self, clave, valor, ttl=None):
+        self._cliente.set(clave, json.dumps(valor), ex=ttl or self.ttl)
+
+    def delete(self, *claves):
+        if claves:
+            self._cliente.delete(*claves)
+
+    def __len__(self):
+        return self._cliente.dbsize()
+
+
+class Cache:
+    """Fachada sobre el backend configurado que lleva la cuenta de aciertos y fallos."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_or_set(self, clave, cargar, ttl=None):
+        try:
+            valor = self.backend.get(clave)
+        except Exception as e:
+            print(f"ADVERTENCIA: caché no disponible ({e}).")
+            return cargar()
+        with self._lock:
+            if valor is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if valor is None:
+            valor = cargar()
+            try:
+                self.backend.set(clave, valor, ttl)
+            except Exception as e:
+                print(f"ADVERTENCIA: no se pudo guardar en caché ({e}).")
+        return valor
+
+    def delete(self, *claves):
+        with self._lock:
+            self.invalidations += 1
+        try:
+            self.backend.delete(*claves)
+        except Exception as e:
+            print(f"ADVERTENCIA: no se pudo invalidar la caché ({e}).")
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'backend': CACHE_BACKEND,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+                'invalidations': self.invalidations,
+            }
+
+
+def crear_cache():
+    if CACHE_BACKEND == 'redis':
+        return Cache(RedisCache(CACHE_URL, CACHE_TTL))
+    if CACHE_BACKEND == 'sqlite':
+        return Cache(SQLiteCache(CACHE_URL or 'cache.db', CACHE_MAX_ENTRIES, CACHE_TTL))
+    return Cache(MemoryCache(CACHE_MAX_ENTRIES, CACHE_TTL))
+
+cache = crear_cache()
+# Las claves incluyen la versión de datos del usuario, así que una escritura ya
+# las deja inalcanzables; el TTL sólo acota cuánto vive una página sin visitas.
+page_cache = PageCache(PAGE_CACHE_MAX_ENTRIES, 3600)
+
+def get_categorias_usuario(user_id):
+    def cargar():
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT nombre FROM categorias WHERE user_id = %s ORDER BY nombre ASC", (user_id,))
+        categorias = [row['nombre'] for row in cursor.fetchall()]
+        cursor.close()
+        return categorias
+    return cache.get_or_set(f"categorias:{user_id}", cargar)
+
+def get_presupuestos_usuario(user_id):
+    def cargar():
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT categoria, monto_maximo FROM presupuestos WHERE user_id = %s ORDER BY categoria", (user_id,))
+        presupuestos = {row['categoria']: float(row['monto_maximo']) for row in cursor.fetchall()}
+        cursor.close()
+        return presupuestos
+    return cache.get_or_set(f"presupuestos:{user_id}", cargar)
+
+def invalidar_cache_usuario(user_id):
+    # Se llama después del commit: invalidar antes dejaría que otra petición
+    # vuelva a cachear los datos viejos mientras la transacción sigue abierta.
+    cache.delete(f"categorias:{user_id}", f"presupuestos:{user_id}")
+
+# --- SQL portable entre Postgres y SQLite ---
+ID_PRIMARY_KEY = "SERIAL PRIMARY KEY" if DATABASE_URL else "INTEGER PRIMARY KEY AUTOINCREMENT"
+SQL_DIA = "CAST(EXTRACT(DAY FROM fecha) AS INTEGER)" if DATABASE_URL else "CAST(strftime('%d', fecha) AS INTEGER)"
+SQL_MES = "CAST(EXTRACT(MONTH FROM fecha) AS INTEGER)" if DATABASE_URL else "CAST(strftime('%m', fecha) AS INTEGER)"
+SQL_ANO = "CAST(EXTRACT(YEAR FROM fecha) AS INTEGER)" if DATABASE_URL else "CAST(strftime('%Y', fecha) AS INTEGER)"
+DIALECTO = "postgres" if DATABASE_URL else "sqlite"
+SQL_FOR_UPDATE = " FOR UPDATE" if DATABASE_URL else ""
+
+def rango_mensual(ano, mes):
+    # Rango semiabierto [inicio, fin) para que los índices sobre fecha sirvan al filtro.
+    inicio = datetime.date(int(ano), int(mes), 1)
+    fin = datetime.date(inicio.year + inicio.month // 12, inicio.month % 12 + 1, 1)
+    return inicio.isoformat(), fin.isoformat()
+
+def rango_anual(ano):
+    return datetime.date(int(ano), 1, 1).isoformat(), datetime.date(int(ano) + 1, 1, 1).isoformat()
+
+def a_fecha(valor):
+    if isinstance(valor, datetime.date):
+        return valor
+    return datetime.date.fromisoformat(str(valor)[:10])
+
+# --- Listado paginado de transacciones ---
+def listar_transacciones(cursor, user_id, ano, mes, limite, despues=None):
+    """Devuelve (filas, siguiente_cursor) de una página del mes, de la más nueva a la más vieja.
+
+    La paginación es por clave (fecha, id): `despues` es el par de la última fila
+    ya entregada, así cada página es un rango del índice y no un OFFSET creciente.
+    """
+    sql = (
+        "SELECT id, fecha, descripcion, monto, tipo, categoria FROM transacciones "
+        "WHERE user_id = %s AND fecha >= %s AND fecha < %s"
+    )
+    params = [user_id, *rango_mensual(ano, mes)]
+    if despues is not None:
+        sql += " AND (fecha, id) < (%s, %s)"
+        params.extend(despues)
+    sql += " ORDER BY fecha DESC, id DESC LIMIT %s"
+    params.append(limite + 1)
+    cursor.execute(sql, params)
+    filas = cursor.fetchall()
+    siguiente_cursor = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        ultima = filas[-1]
+        siguiente_cursor = f"{a_fecha(ultima['fecha']).isoformat()}_{ultima['id']}"
+    return filas, siguiente_cursor
+
+def transaccion_a_json(fila):
+    return {'id': fila['id'], 'fecha': a_fecha(fila['fecha']).isoformat(), 'descripcion': fila['descripcion'],
+            'monto': float(fila['monto']), 'tipo': fila['tipo'], 'categoria': fila['categoria']}
+
+def leer_cursor_transacciones(valor):
+    fecha, _, id_ = valor.partition('_')
+    return datetime.date.fromisoformat(fecha).isoformat(), int(id_)
+
+# --- Agregados mantenidos ---
+# balance_usuario y balance_mensual guardan los totales de ingresos y gastos, y
+# resumen_diario los totales por (día, tipo, categoría), para que el dashboard y
+# los gráficos no tengan que recorrer `transacciones`. Toda escritura sobre
+# `transacciones` debe pasar sus movimientos por actualizar_agregados() dentro de
+# la misma transacción; `flask rebuild-balances` los recalcula desde cero.
+def actualizar_agregados(cursor, movimientos):
+    """Aplica movimientos (user_id, fecha, tipo, categoria, monto, signo) a las tablas de agregados.
+
+    `signo` es 1 para una transacción que aparece y -1 para una que desaparece
+    (una edición son dos movimientos).
+    """
+    por_usuario, por_mes, por_dia, por_categoria = {}, {}, {}, {}
+    for user_id, fecha, tipo, categoria, monto, signo in movimientos:
+        fecha = a_fecha(fecha)
+        monto = float(monto) * signo
+        ingreso, gasto = (monto, 0.0) if tipo == 'ingreso' else (0.0, monto)
+        for acumulado, clave in ((por_usuario, (user_id,)), (por_mes, (user_id, fecha.year, fecha.month))):
+            previo = acumulado.get(clave, (0.0, 0.0))
+            acumulado[clave] = (previo[0] + ingreso, previo[1] + gasto)
+        clave = (user_id, fecha.year, fecha.month, fecha.day, tipo, categoria)
+        previo = por_dia.get(clave, (0.0, 0))
+        por_dia[clave] = (previo[0] + monto, previo[1] + signo)
+        if tipo == 'gasto':
+            clave = (user_id, fecha.year, fecha.month, categoria)
+            por_categoria[clave] = por_categoria.get(clave, 0.0) + monto
+
+    if por_usuario:
+        cursor.executemany(
+            "INSERT INTO balance_usuario (user_id, ingresos, gastos) VALUES (%s, %s, %s) "
+            "ON CONFLICT (user_id) DO UPDATE SET "
+            "ingresos = balance_usuario.ingresos + excluded.ingresos, "
+            "gastos = balance_usuario.gastos + excluded.gastos",
+            [(*clave, round(ing, 2), round(gas, 2)) for clave, (ing, gas) in por_usuario.items()]
+        )
+    if por_mes:
+        cursor.executemany(
+            "INSERT INTO balance_mensual (user_id, ano, mes, ingresos, gastos) VALUES (%s, %s, %s, %s, %s) "
+            "ON CONFLICT (user_id, ano, mes) DO UPDATE SET "
+            "ingresos = balance_mensual.ingresos + excluded.ingresos, "
+            "gastos = balance_mensual.gastos + excluded.gastos",
+            [(*clave, round(ing, 2), round(gas, 2)) for clave, (ing, gas) in por_mes.items()]
+        )
+    if por_dia:
+        cursor.executemany(
+            "INSERT INTO resumen_diario (user_id, ano, mes, dia, tipo, categoria, total, cantidad) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s) "
+            "ON CONFLICT (user_id, ano, mes, dia, tipo, categoria) DO UPDATE SET "
+            "total = resumen_diario.total + excluded.total, "
+            "cantidad = resumen_diario.cantidad + excluded.cantidad",
+            [(*clave, round(total, 2), cantidad) for clave, (total, cantidad) in por_dia.items()]
+        )
+        cursor.execute(
+            "DELETE FROM resumen_diario WHERE cantidad <= 0 AND user_id IN (" +
+            ", ".join(["%s"] * len(por_usuario)) + ")",
+            [clave[0] for clave in por_usuario]
+        )
+    if por_categoria:
+        cursor.executemany(
+            "INSERT INTO estado_presupuestos (user_id, ano, mes, categoria, gastado) VALUES (%s, %s, %s, %s, %s) "
+            "ON CONFLICT (user_id, ano, mes, categoria) DO UPDATE SET "
+            "gastado = estado_presupuestos.gastado + excluded.gastado",
+            [(*clave, round(gastado, 2)) for clave, gastado in por_categoria.items()]
+        )
+        evaluar_umbrales(cursor, por_categoria)
+    if por_usuario:
+        incrementar_version_datos(cursor, [clave[0] for clave in por_usuario])
+
+def incrementar_version_datos(cursor, user_ids):
+    # version_datos cambia con cada escritura de un usuario y sirve de ETag /
+    # clave de caché para todo lo que se calcula a partir de sus datos.
+    for user_id in user_ids:
+        page_cache.delete_usuario(user_id)
+    cursor.executemany(
+        "INSERT INTO version_datos (user_id, version) VALUES (%s, 1) "
+        "ON CONFLICT (user_id) DO UPDATE SET version = version_datos.version + 1",
+        [(user_id,) for user_id in user_ids]
+    )
+
+def leer_version_datos(cursor, user_id):
+    cursor.execute("SELECT version FROM version_datos WHERE user_id = %s", (user_id,))
+    fila = cursor.fetchone()
+    return fila['version'] if fila else 0
+
+def reasignar_categoria_agregados(cursor, user_id, origenes, destino):
+    """Mueve los totales de resumen_diario de las categorías `origenes` a `destino`."""
+    marcadores = ", ".join(["%s"] * len(origenes))
+    cursor.execute(
+        "INSERT INTO resumen_diario (user_id, ano, mes, dia, tipo, categoria, total, cantidad) "
+        "SELECT user_id, ano, mes, dia, tipo, %s, SUM(total), SUM(cantidad) FROM resumen_diario "
+        f"WHERE user_id = %s AND categoria IN ({marcadores}) "
+        "GROUP BY user_id, ano, mes, dia, tipo "
+        "ON CONFLICT (user_id, ano, mes, dia, tipo, categoria) DO UPDATE SET "
+        "total = resumen_diario.total + excluded.total, "
+        "cantidad = resumen_diario.cantidad + excluded.cantidad",
+        (destino, user_id, *origenes)
+    )
+    cursor.execute(
+        f"DELETE FROM resumen_diario WHERE user_id = %s AND categoria IN ({marcadores})",
+        (user_id, *origenes)
+    )
+    cursor.execute(
+        "INSERT INTO estado_presupuestos (user_id, ano, mes, categoria, gastado) "
+        "SELECT user_id, ano, mes, %s, SUM(gastado) FROM estado_presupuestos "
+        f"WHERE user_id = %s AND categoria IN ({marcadores}) "
+        "GROUP BY user_id, ano, mes "
+        "ON CONFLICT (user_id, ano, mes, categoria) DO UPDATE SET "
+        "gastado = estado_presupuestos.gastado + excluded.gastado",
+        (destino, user_id, *origenes)
+    )
+    cursor.execute(
+        f"DELETE FROM estado_presupuestos WHERE user_id = %s AND categoria IN ({marcadores})",
+        (user_id, *origenes)
+    )
+    incrementar_version_datos(cursor, [user_id])
+
+def reconstruir_agregados(cursor, user_id=None):
+    reconstruir_balances(cursor, user_id)
+    reconstruir_estado_presupuestos(cursor, user_id)
+
+def reconstruir_balances(cursor, user_id=None):
+    filtro, params = (" WHERE user_id = %s", (user_id,)) if user_id is not None else ("", ())
+    cursor.execute("DELETE FROM resumen_diario" + filtro, params)
+    cursor.execute("DELETE FROM balance_mensual" + filtro, params)
+    cursor.execute("DELETE FROM balance_usuario" + filtro, params)
+    cursor.execute(
+        "INSERT INTO resumen_diario (user_id, ano, mes, dia, tipo, categoria, total, cantidad) "
+        f"SELECT user_id, {SQL_ANO}, {SQL_MES}, {SQL_DIA}, tipo, categoria, SUM(monto), COUNT(*) "
+        "FROM transacciones" + filtro + " GROUP BY 1, 2, 3, 4, 5, 6",
+        params
+    )
+    cursor.execute(
+        "INSERT INTO balance_mensual (user_id, ano, mes, ingresos, gastos) "
+        "SELECT user_id, ano, mes, "
+        "COALESCE(SUM(CASE WHEN tipo = 'ingreso' THEN total END), 0), "
+        "COALESCE(SUM(CASE WHEN tipo = 'gasto' THEN total END), 0) "
+        "FROM resumen_diario" + filtro + " GROUP BY user_id, ano, mes",
+        params
+    )
+    cursor.execute(
+        "INSERT INTO balance_usuario (user_id, ingresos, gastos) "
+        "SELECT user_id, SUM(ingresos), SUM(gastos) FROM balance_mensual" + filtro + " GROUP BY user_id",
+        params
+    )
+    cursor.execute(
+        "INSERT INTO version_datos (user_id, version) "
+        "SELECT id, 1 FROM users WHERE " + ("id = %s" if user_id is not None else "1 = 1") + " "
+        "ON CONFLICT (user_id) DO UPDATE SET version = version_datos.version + 1",
+        params
+    )
+
+def verificar_agregados(cursor, user_id=None):
+    """Compara los agregados con la suma directa de `transacciones` y devuelve las diferencias."""
+    filtro, params = (" WHERE user_id = %s", (user_id,)) if user_id is not None else ("", ())
+    cursor.execute(
+        f"SELECT user_id, {SQL_ANO} AS ano, {SQL_MES} AS mes, "
+        "COALESCE(SUM(CASE WHEN tipo = 'ingreso' THEN monto END), 0) AS ingresos, "
+        "COALESCE(SUM(CASE WHEN tipo = 'gasto' THEN monto END), 0) AS gastos "
+        "FROM transacciones" + filtro + " GROUP BY 1, 2, 3",
+        params
+    )
+    esperado = {(r['user_id'], r['ano'], r['mes']): (float(r['ingresos']), float(r['gastos'])) for r in cursor.fetchall()}
+    cursor.execute("SELECT user_id, ano, mes, ingresos, gastos FROM balance_mensual" + filtro, params)
+    guardado = {(r['user_id'], r['ano'], r['mes']): (float(r['ingresos']), float(r['gastos'])) for r in cursor.fetchall()}
+
+    esperado_usuario, guardado_usuario = {}, {}
+    for (uid, _, _), (ing, gas) in esperado.items():
+        previo = esperado_usuario.get(uid, (0.0, 0.0))
+        esperado_usuario[uid] = (previo[0] + ing, previo[1] + gas)
+    cursor.execute("SELECT user_id, ingresos, gastos FROM balance_usuario" + filtro, params)
+    for r in cursor.fetchall():
+        guardado_usuario[r['user_id']] = (float(r['ingresos']), float(r['gastos']))
+
+    cursor.execute(
+        f"SELECT user_id, {SQL_ANO} AS ano, {SQL_MES} AS mes, {SQL_DIA} AS dia, tipo, categoria, "
+        "SUM(monto) AS total, COUNT(*) AS cantidad "
+        "FROM transacciones" + filtro + " GROUP BY 1, 2, 3, 4, 5, 6",
+        params
+    )
+    esperado_dia = {
+        (r['user_id'], r['ano'], r['mes'], r['dia'], r['tipo'], r['categoria']): (float(r['total']), r['cantidad'])
+        for r in cursor.fetchall()
+    }
+    cursor.execute("SELECT user_id, ano, mes, dia, tipo, categoria, total, cantidad FROM resumen_diario" + filtro, params)
+    guardado_dia = {
+        (r['user_id'], r['ano'], r['mes'], r['dia'], r['tipo'], r['categoria']): (float(r['total']), r['cantidad'])
+        for r in cursor.fetchall()
+    }
+
+    esperado_estado = {}
+    for (uid, ano, mes, _, tipo, categoria), (total, _) in esperado_dia.items():
+        if tipo == 'gasto':
+            clave = (uid, ano, mes, categoria)
+            esperado_estado[clave] = (esperado_estado.get(clave, (0.0,))[0] + total,)
+    cursor.execute("SELECT user_id, ano, mes, categoria, gastado FROM estado_presupuestos" + filtro, params)
+    guardado_estado = {(r['user_id'], r['ano'], r['mes'], r['categoria']): (float(r['gastado']),) for r in cursor.fetchall()}
+
+    diferencias = []
+    for tabla, a, b in (('balance_mensual', esperado, guardado), ('balance_usuario', esperado_usuario, guardado_usuario),
+                        ('resumen_diario', esperado_dia, guardado_dia), ('estado_presupuestos', esperado_estado, guardado_estado)):
+        for clave in sorted(set(a) | set(b)):
+            vacio = (0.0,) * len(a.get(clave) or b.get(clave))
+            valor_a, valor_b = a.get(clave, vacio), b.get(clave, vacio)
+            if any(abs(x - y) > 0.005 for x, y in zip(valor_a, valor_b)):
+                diferencias.append((tabla, clave, valor_a, valor_b))
+    return diferencias
+
+def fusionar_categorias(cursor, user_id, origenes, destino, fusionar_presupuestos=True):
+    """Pasa las transacciones, reglas recurrentes, agregados y presupuestos de `origenes` a `destino`.
+
+    Sirve para renombrar (una categoría origen) y para fusionar varias. Son
+    sentencias sobre conjuntos que usan idx_transacciones_user_categoria; el
+    commit queda a cargo del llamador. Si `fusionar_presupuestos` es False los
+    presupuestos de los orígenes se borran en lugar de sumarse al destino.
+    """
+    origenes = [o for o in origenes if o != destino]
+    if not origenes:
+        return
+    marcadores = ", ".join(["%s"] * len(origenes))
+    cursor.execute(
+        f"UPDATE transacciones SET categoria = %s WHERE user_id = %s AND categoria IN ({marcadores})",
+        (destino, user_id, *origenes)
+    )
+    reasignar_categoria_agregados(cursor, user_id, origenes, destino)
+    # Las reglas recurrentes siguen a sus transacciones: si no, volverían a generar la categoría borrada.
+    cursor.execute(
+        f"UPDATE transacciones_recurrentes SET categoria = %s WHERE user_id = %s AND categoria IN ({marcadores})",
+        (destino, user_id, *origenes)
+    )
+    if fusionar_presupuestos:
+        cursor.execute(
+            "INSERT INTO presupuestos (user_id, categoria, monto_maximo) "
+            "SELECT user_id, %s, SUM(monto_maximo) FROM presupuestos "
+            f"WHERE user_id = %s AND categoria IN ({marcadores}) GROUP BY user_id "
+            "ON CONFLICT (user_id, categoria) DO UPDATE SET "
+            "monto_maximo = presupuestos.monto_maximo + excluded.monto_maximo",
+            (destino, user_id, *origenes)
+        )
+    cursor.execute(
+        f"DELETE FROM presupuestos WHERE user_id = %s AND categoria IN ({marcadores})",
+        (user_id, *origenes)
+    )
+    cursor.execute(
+        "INSERT INTO categorias (user_id, nombre) VALUES (%s, %s) ON CONFLICT (user_id, nombre) DO NOTHING",
+        (user_id, destino)
+    )
+    cursor.execute(
+        f"DELETE FROM categorias WHERE user_id = %s AND nombre IN ({marcadores})",
+        (user_id, *origenes)
+    )
+
 def create_default_categories(user_id):
     default_categories = [
         ('Comida', user_id), ('Transporte', user_id), ('Vivienda', user_id), ('Ocio', user_id), 
@@ -97,29 +1056,149 @@ def create_default_categories(user_id):
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.executemany("INSERT INTO categorias (nombre, user_id) VALUES (%s, %s)", default_categories)
+        incrementar_version_datos(cursor, [user_id])
         conn.commit()
         cursor.close()
         conn.close()
+        invalidar_cache_usuario(user_id)
         print(f"Categorías por defecto creadas para el user {user_id}.")
     except Exception as e:
         print(f"Error creando categorías por defecto: {e}")
 
-def init_db_logic():
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+# --- Estado de presupuestos ---
+# estado_presupuestos guarda lo gastado por (usuario, año, mes, categoría) y se
+# mantiene en actualizar_agregados. Cuando un gasto hace que una categoría con
+# presupuesto cruce alguno de UMBRALES_PRESUPUESTO (en %) se llama a los hooks
+# registrados con @al_cruzar_umbral, dentro de la misma transacción.
+HOOKS_UMBRAL_PRESUPUESTO = []
+
+def al_cruzar_umbral(funcion):
+    HOOKS_UMBRAL_PRESUPUESTO.append(funcion)
+    return funcion
+
+def porcentajes_presupuesto(gastado, presupuesto):
+    if presupuesto > 0:
+        porcentaje_real = round((float(gastado) / float(presupuesto)) * 100)
+        return {'porcentaje': min(porcentaje_real, 100), 'porcentaje_real': porcentaje_real}
+    return {'porcentaje': 0, 'porcentaje_real': 0}
+
+def emitir_cruces_umbral(cursor, user_id, ano, mes, categoria, gastado_antes, gastado, presupuesto_antes, presupuesto):
+    for umbral in UMBRALES_PRESUPUESTO:
+        antes = presupuesto_antes > 0 and gastado_antes * 100 >= umbral * presupuesto_antes
+        ahora = presupuesto > 0 and gastado * 100 >= umbral * presupuesto
+        if ahora and not antes:
+            evento = {'user_id': user_id, 'ano': ano, 'mes': mes, 'categoria': categoria, 'umbral': umbral,
+                      'gastado': round(gastado, 2), 'presupuesto': round(presupuesto, 2)}
+            for hook in HOOKS_UMBRAL_PRESUPUESTO:
+                hook(cursor, evento)
+
+def evaluar_umbrales(cursor, incrementos):
+    """Busca cruces de umbral para los gastos recién sumados.
+
+    `incrementos` es {(user_id, ano, mes, categoria): monto sumado}; sólo se
+    consultan las categorías que tienen presupuesto, de a 1000 claves.
+    """
+    claves = [clave for clave, delta in incrementos.items() if delta > 0]
+    for i in range(0, len(claves), 1000):
+        trozo = claves[i:i + 1000]
+        cursor.execute(
+            "SELECT e.user_id, e.ano, e.mes, e.categoria, e.gastado, p.monto_maximo "
+            "FROM estado_presupuestos e "
+            "JOIN presupuestos p ON p.user_id = e.user_id AND p.categoria = e.categoria "
+            "WHERE p.monto_maximo > 0 AND (e.user_id, e.ano, e.mes, e.categoria) IN (VALUES " +
+            ", ".join(["(%s, %s, %s, %s)"] * len(trozo)) + ")",
+            [valor for clave in trozo for valor in clave]
+        )
+        for row in cursor.fetchall():
+            clave = (row['user_id'], row['ano'], row['mes'], row['categoria'])
+            gastado, presupuesto = float(row['gastado']), float(row['monto_maximo'])
+            emitir_cruces_umbral(cursor, *clave, gastado - incrementos[clave], gastado, presupuesto, presupuesto)
+
+@al_cruzar_umbral
+def notificar_umbral(cursor, evento):
+    if evento['umbral'] >= 100:
+        mensaje = f"Superaste el presupuesto de {evento['categoria']} en {evento['mes']:02d}/{evento['ano']}."
+    else:
+        mensaje = f"Llevas el {evento['umbral']}% del presupuesto de {evento['categoria']} en {evento['mes']:02d}/{evento['ano']}."
+    cursor.execute(
+        "INSERT INTO notificaciones (user_id, tipo, mensaje) VALUES (%s, %s, %s)",
+        (evento['user_id'], 'presupuesto', mensaje)
+    )
+
+def leer_estado_presupuestos(cursor, user_id, ano, mes):
+    """Categorías del usuario con su presupuesto y lo gastado en el mes, ordenadas por nombre."""
+    cursor.execute(
+        "SELECT c.nombre AS categoria, "
+        "COALESCE(p.monto_maximo, 0) AS presupuesto, "
+        "COALESCE(e.gastado, 0) AS gastado "
+        "FROM categorias c "
+        "LEFT JOIN presupuestos p ON p.user_id = c.user_id AND p.categoria = c.nombre "
+        "LEFT JOIN estado_presupuestos e ON e.user_id = c.user_id AND e.ano = %s AND e.mes = %s AND e.categoria = c.nombre "
+        "WHERE c.user_id = %s ORDER BY c.nombre ASC",
+        (int(ano), int(mes), user_id)
+    )
+    return [
+        {'categoria': row['categoria'], 'gastado': row['gastado'], 'presupuesto': row['presupuesto'],
+         **porcentajes_presupuesto(row['gastado'], row['presupuesto'])}
+        for row in cursor.fetchall()
+    ]
+
+def reconstruir_estado_presupuestos(cursor, user_id=None):
+    filtro, params = (" AND user_id = %s", (user_id,)) if user_id is not None else ("", ())
+    cursor.execute("DELETE FROM estado_presupuestos WHERE 1 = 1" + filtro, params)
+    cursor.execute(
+        "INSERT INTO estado_presupuestos (user_id, ano, mes, categoria, gastado) "
+        "SELECT user_id, ano, mes, categoria, SUM(total) FROM resumen_diario "
+        "WHERE tipo = 'gasto'" + filtro + " GROUP BY user_id, ano, mes, categoria",
+        params
+    )
+
+# --- Migraciones de esquema ---
+# Cada migración es (versión, descripción, pasos). Un paso puede ser:
+#   - un string SQL,
+#   - un dict {'postgres': paso, 'sqlite': paso} cuando cambia según el motor
+#     (si falta la clave del motor actual el paso se omite),
+#   - un Indice, que en Postgres se crea con CONCURRENTLY fuera de la transacción,
+#   - una función que recibe el cursor (p. ej. agregar_columna(...)).
+# Las migraciones ya publicadas no se editan: los cambios van en una nueva.
+class Indice:
+    def __init__(self, nombre, tabla, columnas, using=None, unico=False):
+        self.nombre = nombre
+        self.tabla = tabla
+        self.columnas = columnas
+        self.using = using
+        self.unico = unico
+
+    def sql(self, concurrente, solo_padre=False):
+        using = f" USING {self.using}" if self.using else ""
+        return (f"CREATE {'UNIQUE ' if self.unico else ''}INDEX {'CONCURRENTLY ' if concurrente else ''}IF NOT EXISTS "
+                f"{self.nombre} ON {'ONLY ' if solo_padre else ''}{self.tabla}{using} ({self.columnas})")
+
+
+def agregar_columna(tabla, columna, tipo):
+    """Paso ALTER TABLE ... ADD COLUMN que no falla si la columna ya existe."""
+    def paso(cursor):
+        if DATABASE_URL:
+            cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN IF NOT EXISTS {columna} {tipo}")
+            return
+        cursor.execute(f"PRAGMA table_info({tabla})")
+        if columna not in {fila['name'] for fila in cursor.fetchall()}:
+            cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN {columna} {tipo}")
+    return paso
+
+
+MIGRACIONES = [
+    (1, 'Tablas base', [
+        f'''
         CREATE TABLE IF NOT EXISTS users (
-            id SERIAL PRIMARY KEY,
+            id {ID_PRIMARY_KEY},
             email VARCHAR(255) NOT NULL UNIQUE,
             password_hash TEXT NOT NULL
         )
-        ''')
-        
-        cursor.execute('''
+        ''',
+        f'''
         CREATE TABLE IF NOT EXISTS transacciones (
-            id SERIAL PRIMARY KEY,
+            id {ID_PRIMARY_KEY},
             user_id INTEGER NOT NULL,
             fecha DATE NOT NULL,
             descripcion VARCHAR(255) NOT NULL,
@@ -128,42 +1207,586 @@ def init_db_logic():
             categoria VARCHAR(100) DEFAULT 'Otros',
             FOREIGN KEY (user_id) REFERENCES users (id)
         )
-        ''')
-
-        cursor.execute('''
+        ''',
+        f'''
         CREATE TABLE IF NOT EXISTS presupuestos (
-            id SERIAL PRIMARY KEY,
+            id {ID_PRIMARY_KEY},
             user_id INTEGER NOT NULL,
             categoria VARCHAR(100) NOT NULL,
             monto_maximo DECIMAL(10, 2) NOT NULL,
             FOREIGN KEY (user_id) REFERENCES users (id),
             UNIQUE(user_id, categoria)
         )
-        ''')
-        
-        cursor.execute('''
+        ''',
+        f'''
         CREATE TABLE IF NOT EXISTS categorias (
-            id SERIAL PRIMARY KEY,
+            id {ID_PRIMARY_KEY},
             user_id INTEGER NOT NULL,
             nombre VARCHAR(100) NOT NULL,
             FOREIGN KEY (user_id) REFERENCES users (id),
             UNIQUE(user_id, nombre)
         )
-        ''')
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        print("Database initialized/migrated successfully.")
-    except Exception as e:
-        print(f"An error occurred while initializing the DB: {e}")
-
+        ''',
+    ]),
+    (2, 'Agregados mantenidos', [
+        '''
+        CREATE TABLE IF NOT EXISTS balance_usuario (
+            user_id INTEGER PRIMARY KEY,
+            ingresos DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            gastos DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS version_datos (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS resumen_diario (
+            user_id INTEGER NOT NULL,
+            ano INTEGER NOT NULL,
+            mes INTEGER NOT NULL,
+            dia INTEGER NOT NULL,
+            tipo VARCHAR(10) NOT NULL,
+            categoria VARCHAR(100) NOT NULL,
+            total DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            cantidad INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, ano, mes, dia, tipo, categoria),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS balance_mensual (
+            user_id INTEGER NOT NULL,
+            ano INTEGER NOT NULL,
+            mes INTEGER NOT NULL,
+            ingresos DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            gastos DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, ano, mes),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        # Bases anteriores a los agregados: se llenan desde transacciones.
+        # Cada migración reconstruye sólo las tablas que crea: las posteriores todavía no existen.
+        lambda cursor: reconstruir_balances(cursor),
+    ]),
+    # Índices para los filtros por usuario y rango de fechas del dashboard y los gráficos.
+    # El de tipo incluye categoria y monto para agrupar sin leer la tabla.
+    (3, 'Índices de transacciones', [
+        Indice('idx_transacciones_user_fecha', 'transacciones', 'user_id, fecha'),
+        Indice('idx_transacciones_user_tipo_fecha', 'transacciones', 'user_id, tipo, fecha, categoria, monto'),
+        Indice('idx_transacciones_user_categoria', 'transacciones', 'user_id, categoria'),
+    ]),
+    # `dia` guarda el día del mes pedido, para volver al 31 después de un mes corto.
+    (4, 'Transacciones recurrentes', [
+        f'''
+        CREATE TABLE IF NOT EXISTS transacciones_recurrentes (
+            id {ID_PRIMARY_KEY},
+            user_id INTEGER NOT NULL,
+            descripcion VARCHAR(255) NOT NULL,
+            monto DECIMAL(10, 2) NOT NULL,
+            tipo VARCHAR(10) NOT NULL CHECK(tipo IN ('ingreso', 'gasto')),
+            categoria VARCHAR(100) NOT NULL DEFAULT 'Otros',
+            frecuencia VARCHAR(10) NOT NULL CHECK(frecuencia IN ('semanal', 'mensual', 'anual')),
+            dia INTEGER NOT NULL,
+            proxima_fecha DATE NOT NULL,
+            activa BOOLEAN NOT NULL DEFAULT TRUE,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        agregar_columna('transacciones', 'recurrente_id', 'INTEGER'),
+        Indice('idx_recurrentes_proxima_fecha', 'transacciones_recurrentes', 'proxima_fecha, id'),
+        Indice('idx_recurrentes_user', 'transacciones_recurrentes', 'user_id'),
+        # Hace idempotente la materialización: una (regla, fecha) sólo puede existir una vez.
+        Indice('idx_transacciones_recurrente_fecha', 'transacciones', 'recurrente_id, fecha', unico=True),
+    ]),
+    (5, 'Estado de presupuestos y notificaciones', [
+        '''
+        CREATE TABLE IF NOT EXISTS estado_presupuestos (
+            user_id INTEGER NOT NULL,
+            ano INTEGER NOT NULL,
+            mes INTEGER NOT NULL,
+            categoria VARCHAR(100) NOT NULL,
+            gastado DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, ano, mes, categoria),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        f'''
+        CREATE TABLE IF NOT EXISTS notificaciones (
+            id {ID_PRIMARY_KEY},
+            user_id INTEGER NOT NULL,
+            tipo VARCHAR(30) NOT NULL,
+            mensaje VARCHAR(255) NOT NULL,
+            creada_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            leida BOOLEAN NOT NULL DEFAULT FALSE,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        Indice('idx_notificaciones_user', 'notificaciones', 'user_id, leida, id'),
+        lambda cursor: reconstruir_estado_presupuestos(cursor),
+    ]),
+    (6, 'Búsqueda por descripción', [
+        {'postgres': Indice('idx_transacciones_busqueda', 'transacciones', "to_tsvector('simple', descripcion)", using='gin')},
+        {'sqlite': '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS transacciones_fts USING fts5(
+            descripcion, user_id,
+            content='transacciones', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        '''},
+        {'sqlite': '''
+        CREATE TRIGGER IF NOT EXISTS transacciones_fts_insert AFTER INSERT ON transacciones BEGIN
+            INSERT INTO transacciones_fts (rowid, descripcion, user_id) VALUES (new.id, new.descripcion, new.user_id);
+        END
+        '''},
+        {'sqlite': '''
+        CREATE TRIGGER IF NOT EXISTS transacciones_fts_delete AFTER DELETE ON transacciones BEGIN
+            INSERT INTO transacciones_fts (transacciones_fts, rowid, descripcion, user_id) VALUES ('delete', old.id, old.descripcion, old.user_id);
+        END
+        '''},
+        {'sqlite': '''
+        CREATE TRIGGER IF NOT EXISTS transacciones_fts_update AFTER UPDATE OF descripcion, user_id ON transacciones BEGIN
+            INSERT INTO transacciones_fts (transacciones_fts, rowid, descripcion, user_id) VALUES ('delete', old.id, old.descripcion, old.user_id);
+            INSERT INTO transacciones_fts (rowid, descripcion, user_id) VALUES (new.id, new.descripcion, new.user_id);
+        END
+        '''},
+        {'sqlite': "INSERT INTO transacciones_fts (transacciones_fts) VALUES ('rebuild')"},
+    ]),
+]
+
+# Clave arbitraria para el advisory lock que evita dos db-upgrade a la vez en Postgres.
+LOCK_MIGRACIONES = 4242018
+
+def asegurar_tabla_versiones(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        descripcion VARCHAR(255) NOT NULL,
+        aplicada_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    # FALSE mientras faltan los índices CONCURRENTLY de la migración (ver aplicar_migracion).
+    agregar_columna('schema_version', 'completa', 'BOOLEAN NOT NULL DEFAULT TRUE')(cursor)
+
+def versiones_aplicadas(cursor):
+    cursor.execute("SELECT version, descripcion, aplicada_en, completa FROM schema_version ORDER BY version")
+    return {row['version']: row for row in cursor.fetchall()}
+
+def _crear_indice_concurrente(conn, indice):
+    # CREATE INDEX CONCURRENTLY no puede ir dentro de una transacción y, si
+    # falla a medias, deja un índice INVALID que IF NOT EXISTS no reintentaría.
+    cursor = conn.cursor()
+    if es_tabla_particionada(cursor, indice.tabla):
+        _crear_indice_particionado(conn, cursor, indice)
+        cursor.close()
+        return
+    cursor.execute(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = %s AND NOT i.indisvalid",
+        (indice.nombre,)
+    )
+    if cursor.fetchone():
+        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {indice.nombre}")
+    cursor.execute(indice.sql(concurrente=True))
+    cursor.close()
+
+def _crear_indice_particionado(conn, cursor, indice):
+    # CONCURRENTLY no existe para tablas particionadas: el índice se crea sólo en
+    # el padre (queda inválido), se construye en cada partición sin bloquear y se
+    # adjunta; al adjuntar la última, el del padre pasa a ser válido.
+    cursor.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (indice.nombre,))
+    fila = cursor.fetchone()
+    if fila and fila['indisvalid']:
+        return
+    cursor.execute(indice.sql(concurrente=False, solo_padre=True))
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s)",
+        (indice.tabla,)
+    )
+    for particion in [fila['relname'] for fila in cursor.fetchall()]:
+        hijo = Indice(f"{indice.nombre}__{particion}", particion, indice.columnas, indice.using, indice.unico)
+        _crear_indice_concurrente(conn, hijo)
+        cursor.execute("SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(%s)", (hijo.nombre,))
+        if not cursor.fetchone():
+            cursor.execute(f"ALTER INDEX {indice.nombre} ATTACH PARTITION {hijo.nombre}")
+
+def aplicar_migracion(conn, version, descripcion, pasos, pendiente_indices=False):
+    """Aplica una migración en dos fases.
+
+    Los pasos comunes y la fila de schema_version se confirman juntos en una
+    transacción (en SQLite con un BEGIN explícito, porque sqlite3 no abre
+    transacción antes del DDL). En Postgres los Indice se construyen después con
+    CONCURRENTLY, fuera de esa transacción; mientras tanto la versión queda con
+    completa = FALSE. Si la construcción falla, el siguiente db-upgrade no
+    repite los pasos comunes: sólo reintenta los índices (que son idempotentes).
+    """
+    cursor = conn.cursor()
+    indices_concurrentes = []
+    if DIALECTO == 'sqlite' and not conn.in_transaction:
+        cursor.execute("BEGIN")
+    for paso in pasos:
+        if isinstance(paso, dict):
+            paso = paso.get(DIALECTO)
+            if paso is None:
+                continue
+        if isinstance(paso, Indice):
+            if DATABASE_URL:
+                indices_concurrentes.append(paso)
+            elif not pendiente_indices:
+                cursor.execute(paso.sql(concurrente=False))
+        elif pendiente_indices:
+            continue
+        elif callable(paso):
+            paso(cursor)
+        else:
+            cursor.execute(paso)
+    if not pendiente_indices:
+        cursor.execute(
+            "INSERT INTO schema_version (version, descripcion, completa) VALUES (%s, %s, %s)",
+            (version, descripcion, not indices_concurrentes)
+        )
+    conn.commit()
+    if indices_concurrentes:
+        conn.set_session(autocommit=True)
+        try:
+            for indice in indices_concurrentes:
+                _crear_indice_concurrente(conn, indice)
+        finally:
+            conn.set_session(autocommit=False)
+        cursor.execute("UPDATE schema_version SET completa = TRUE WHERE version = %s", (version,))
+        conn.commit()
+    cursor.close()
+
+def aplicar_migraciones(conn, hasta=None, log=print):
+    """Aplica en orden las migraciones pendientes; devuelve las versiones aplicadas.
+
+    Cada migración corre en su propia transacción (salvo sus índices
+    CONCURRENTLY, ver aplicar_migracion): si una falla se hace rollback, se
+    propaga el error y las siguientes no se intentan. Las que quedaron con
+    índices pendientes se retoman desde ese punto.
+    """
+    cursor = conn.cursor()
+    if DATABASE_URL:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (LOCK_MIGRACIONES,))
+    try:
+        asegurar_tabla_versiones(cursor)
+        conn.commit()
+        aplicadas = versiones_aplicadas(cursor)
+        nuevas = []
+        for version, descripcion, pasos in MIGRACIONES:
+            fila = aplicadas.get(version)
+            if (fila and fila['completa']) or (hasta is not None and version > hasta):
+                continue
+            if fila:
+                log(f"Retomando índices de la migración {version}: {descripcion}")
+            else:
+                log(f"Aplicando migración {version}: {descripcion}")
+            try:
+                aplicar_migracion(conn, version, descripcion, pasos, pendiente_indices=fila is not None)
+            except Exception:
+                conn.rollback()
+                raise
+            nuevas.append(version)
+        return nuevas
+    finally:
+        if DATABASE_URL:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (LOCK_MIGRACIONES,))
+            conn.commit()
+        cursor.close()
+
+def init_db_logic():
+    conn = get_db_connection()
+    try:
+        aplicadas = aplicar_migraciones(conn)
+    finally:
+        conn.close()
+    if aplicadas:
+        print(f"Migraciones aplicadas: {', '.join(map(str, aplicadas))}.")
+    else:
+        print("La base de datos ya está al día.")
+
 @app.cli.command('init-db')
 def init_db_command():
     init_db_logic()
     click.echo('Base de datos inicializada.')
 
-set_locale()
+@app.cli.command('db-upgrade')
+@click.option('--to', 'hasta', type=int, default=None, help='Aplicar sólo hasta esta versión.')
+def db_upgrade_command(hasta):
+    conn = get_db_connection()
+    try:
+        aplicadas = aplicar_migraciones(conn, hasta, log=click.echo)
+    finally:
+        conn.close()
+    click.echo(f"Aplicadas: {', '.join(map(str, aplicadas))}." if aplicadas else 'Nada que aplicar.')
+
+@app.cli.command('db-status')
+def db_status_command():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    asegurar_tabla_versiones(cursor)
+    conn.commit()
+    aplicadas = versiones_aplicadas(cursor)
+    cursor.close()
+    conn.close()
+    for version, descripcion, _ in MIGRACIONES:
+        fila = aplicadas.get(version)
+        if not fila:
+            estado = 'pendiente'
+        elif not fila['completa']:
+            estado = 'índices pendientes'
+        else:
+            estado = f"aplicada {fila['aplicada_en']}"
+        click.echo(f"{version:>4}  {estado:<32} {descripcion}")
+
+# --- Particionado de transacciones (sólo Postgres) ---
+# Opcional: `flask partition-transactions` convierte transacciones en una tabla
+# particionada por rango de fecha, mensual o anual según TRANSACCIONES_PARTICION.
+# El listado del dashboard y la exportación filtran por rango de fecha, así que
+# el planner descarta las demás particiones. Una partición DEFAULT recibe lo que
+# cae fuera de las creadas; create-partitions mueve esas filas a la suya.
+# Las búsquedas por id (editar/borrar) no llevan fecha y revisan cada partición
+# por su clave primaria (id, fecha).
+def _requiere_postgres():
+    if not DATABASE_URL:
+        raise click.ClickException("El particionado sólo está disponible con Postgres (DATABASE_URL).")
+
+def periodo_particion(fecha):
+    """Devuelve (inicio, fin, nombre) de la partición que contiene `fecha`."""
+    if TRANSACCIONES_PARTICION == 'anual':
+        return datetime.date(fecha.year, 1, 1), datetime.date(fecha.year + 1, 1, 1), f"transacciones_p{fecha.year}"
+    inicio, fin = rango_mensual(fecha.year, fecha.month)
+    return datetime.date.fromisoformat(inicio), datetime.date.fromisoformat(fin), f"transacciones_p{fecha.year}_{fecha.month:02d}"
+
+def periodos_particion(desde, hasta):
+    fecha = periodo_particion(desde)[0]
+    while fecha <= hasta:
+        yield fecha
+        fecha = periodo_particion(fecha)[1]
+
+def es_tabla_particionada(cursor, tabla):
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (tabla,))
+    fila = cursor.fetchone()
+    return bool(fila) and fila['relkind'] == 'p'
+
+def particiones_transacciones(cursor):
+    """Particiones por rango como [(nombre, desde, hasta)] ordenadas; la DEFAULT no se incluye."""
+    cursor.execute(
+        "SELECT c.relname AS nombre, pg_get_expr(c.relpartbound, c.oid) AS limites "
+        "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'transacciones'::regclass"
+    )
+    particiones = []
+    for fila in cursor.fetchall():
+        fechas = re.findall(r"'(\d{4}-\d{2}-\d{2})'", fila['limites'])
+        if len(fechas) == 2:
+            particiones.append((fila['nombre'], *map(datetime.date.fromisoformat, fechas)))
+    return sorted(particiones, key=lambda particion: particion[1])
+
+def crear_particion(cursor, fecha):
+    """Crea la partición del periodo de `fecha` si falta y le pasa sus filas de la DEFAULT."""
+    inicio, fin, nombre = periodo_particion(fecha)
+    cursor.execute("SELECT to_regclass(%s) AS existe", (nombre,))
+    if cursor.fetchone()['existe']:
+        return None
+    # Se crea suelta y después se adjunta: ATTACH falla si la DEFAULT tiene filas del rango.
+    cursor.execute(f"CREATE TABLE {nombre} (LIKE transacciones INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cursor.execute(
+        "WITH movidas AS (DELETE FROM transacciones_default WHERE fecha >= %s AND fecha < %s RETURNING *) "
+        f"INSERT INTO {nombre} SELECT * FROM movidas",
+        (inicio, fin)
+    )
+    cursor.execute(f"ALTER TABLE transacciones ATTACH PARTITION {nombre} FOR VALUES FROM ('{inicio}') TO ('{fin}')")
+    return nombre
+
+def sumar_periodos(fecha, cantidad):
+    for _ in range(cantidad):
+        fecha = periodo_particion(fecha)[1]
+    return fecha
+
+@app.cli.command('partition-transactions')
+@click.option('--ahead', type=int, default=PARTICIONES_ADELANTE, help='Periodos futuros a crear.')
+def partition_transactions_command(ahead):
+    """Convierte transacciones en tabla particionada (bloquea la tabla mientras copia)."""
+    _requiere_postgres()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if es_tabla_particionada(cursor, 'transacciones'):
+        raise click.ClickException("transacciones ya está particionada.")
+    cursor.execute("LOCK TABLE transacciones IN ACCESS EXCLUSIVE MODE")
+    cursor.execute("ALTER TABLE transacciones RENAME TO transacciones_sin_particionar")
+    cursor.execute("ALTER INDEX transacciones_pkey RENAME TO transacciones_sin_particionar_pkey")
+    cursor.execute(
+        "CREATE TABLE transacciones ("
+        "LIKE transacciones_sin_particionar INCLUDING DEFAULTS INCLUDING CONSTRAINTS, "
+        "PRIMARY KEY (id, fecha), FOREIGN KEY (user_id) REFERENCES users (id)"
+        ") PARTITION BY RANGE (fecha)"
+    )
+    cursor.execute("CREATE TABLE transacciones_default PARTITION OF transacciones DEFAULT")
+    cursor.execute("SELECT MIN(fecha) AS desde FROM transacciones_sin_particionar")
+    hoy = datetime.date.today()
+    desde = cursor.fetchone()['desde'] or hoy
+    for fecha in periodos_particion(desde, sumar_periodos(hoy, ahead)):
+        inicio, fin, nombre = periodo_particion(fecha)
+        cursor.execute(f"CREATE TABLE {nombre} PARTITION OF transacciones FOR VALUES FROM ('{inicio}') TO ('{fin}')")
+    cursor.execute("INSERT INTO transacciones SELECT * FROM transacciones_sin_particionar")
+    # La secuencia del id pertenece a la tabla vieja: sin esto el DROP se la llevaría.
+    cursor.execute("ALTER SEQUENCE transacciones_id_seq OWNED BY transacciones.id")
+    cursor.execute("DROP TABLE transacciones_sin_particionar")
+    for _, _, pasos in MIGRACIONES:
+        for paso in pasos:
+            paso = paso.get(DIALECTO) if isinstance(paso, dict) else paso
+            if isinstance(paso, Indice) and paso.tabla == 'transacciones':
+                cursor.execute(paso.sql(concurrente=False))
+    conn.commit()
+    cursor.close()
+    conn.close()
+    click.echo(f"transacciones particionada ({TRANSACCIONES_PARTICION}) desde {desde}.")
+
+@app.cli.command('create-partitions')
+@click.option('--ahead', type=int, default=PARTICIONES_ADELANTE, help='Periodos futuros a crear.')
+def create_partitions_command(ahead):
+    """Crea las particiones que falten hasta `ahead` periodos adelante (para cron)."""
+    _requiere_postgres()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if not es_tabla_particionada(cursor, 'transacciones'):
+        raise click.ClickException("transacciones no está particionada; usa partition-transactions.")
+    hoy = datetime.date.today()
+    # También los periodos de filas que hayan caído en la DEFAULT.
+    cursor.execute("SELECT MIN(fecha) AS desde, MAX(fecha) AS hasta FROM transacciones_default")
+    fuera = cursor.fetchone()
+    fechas = set(periodos_particion(hoy, sumar_periodos(hoy, ahead)))
+    if fuera['desde']:
+        fechas.update(periodos_particion(fuera['desde'], fuera['hasta']))
+    creadas = [nombre for nombre in (crear_particion(cursor, fecha) for fecha in sorted(fechas)) if nombre]
+    conn.commit()
+    cursor.close()
+    conn.close()
+    click.echo(f"Creadas: {', '.join(creadas)}." if creadas else 'No faltaba ninguna partición.')
+
+@app.cli.command('archive-partitions')
+@click.option('--before', 'antes', required=True, type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Archivar las particiones que terminan en o antes de esta fecha.')
+@click.option('--drop', is_flag=True, help='Borrarlas en vez de moverlas al esquema archivo.')
+def archive_partitions_command(antes, drop):
+    """Desprende particiones viejas de transacciones y las mueve al esquema archivo (o las borra)."""
+    _requiere_postgres()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if not es_tabla_particionada(cursor, 'transacciones'):
+        raise click.ClickException("transacciones no está particionada.")
+    archivadas = []
+    for nombre, _, hasta in particiones_transacciones(cursor):
+        if hasta > antes.date():
+            continue
+        cursor.execute(f"ALTER TABLE transacciones DETACH PARTITION {nombre}")
+        if drop:
+            cursor.execute(f"DROP TABLE {nombre}")
+        else:
+            cursor.execute("CREATE SCHEMA IF NOT EXISTS archivo")
+            cursor.execute(f"ALTER TABLE {nombre} SET SCHEMA archivo")
+        archivadas.append(nombre)
+    conn.commit()
+    cursor.close()
+    conn.close()
+    if not archivadas:
+        click.echo('No hay particiones para archivar.')
+        return
+    click.echo(f"{'Borradas' if drop else 'Movidas a archivo'}: {', '.join(archivadas)}.")
+    # Los agregados conservan esos meses; reconstruirlos ahora los perdería.
+    click.echo("Aviso: rebuild-balances y check-balances sólo ven las particiones vigentes.", err=True)
+
+@app.cli.command('rebuild-balances')
+@click.option('--user-id', type=int, default=None, help='Recalcular sólo este usuario.')
+def rebuild_balances_command(user_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    reconstruir_agregados(cursor, user_id)
+    conn.commit()
+    cursor.close()
+    conn.close()
+    click.echo('Balances recalculados.')
+
+@app.cli.command('import-transactions')
+@click.argument('archivo', type=click.Path(exists=True, dir_okay=False))
+@click.option('--email', required=True, help='Usuario dueño de las transacciones.')
+def import_transactions_command(archivo, email):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
+    user_db = cursor.fetchone()
+    cursor.close()
+    if not user_db:
+        raise click.ClickException(f"No existe el usuario {email}.")
+    with open(archivo, newline='', encoding='utf-8-sig') as f:
+        resultado = importar_transacciones(conn, user_db['id'], f)
+    conn.close()
+    for linea, mensaje in resultado['errores']:
+        click.echo(f"Línea {linea}: {mensaje}", err=True)
+    click.echo(f"Importadas {resultado['importadas']} transacciones en {resultado.get('segundos', 0)} s "
+               f"({resultado.get('filas_por_segundo', 0)} filas/s), {len(resultado['errores'])} errores.")
+
+@app.cli.command('check-balances')
+@click.option('--user-id', type=int, default=None, help='Verificar sólo este usuario.')
+def check_balances_command(user_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    diferencias = verificar_agregados(cursor, user_id)
+    cursor.close()
+    conn.close()
+    for tabla, clave, esperado, guardado in diferencias:
+        click.echo(f"{tabla} {clave}: esperado {esperado}, guardado {guardado}")
+    if diferencias:
+        raise click.ClickException(f"{len(diferencias)} diferencias. Ejecuta 'flask rebuild-balances' para repararlas.")
+    click.echo('Balances consistentes.')
+
+# --- Hashing de contraseñas ---
+# bcrypt es caro a propósito: se ejecuta en un pool acotado para que una ráfaga
+# de logins no acapare la CPU del worker. Si ya hay HASH_WORKERS + HASH_QUEUE_MAX
+# operaciones en curso, se rechaza enseguida con 503 en vez de encolar más.
+class HashSaturadoError(Exception):
+    pass
+
+_ejecutor_hash = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='bcrypt')
+_cupos_hash = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE_MAX)
+
+def ejecutar_hash(operacion, funcion, *args):
+    if not _cupos_hash.acquire(blocking=False):
+        metricas.registrar_hash(operacion, None)
+        raise HashSaturadoError()
+    try:
+        inicio = time.perf_counter()
+        resultado = _ejecutor_hash.submit(funcion, *args).result()
+        # La latencia incluye la espera en cola, que es lo que nota el usuario.
+        metricas.registrar_hash(operacion, time.perf_counter() - inicio)
+        return resultado
+    finally:
+        _cupos_hash.release()
+
+def generar_hash(password):
+    return ejecutar_hash('generar', bcrypt.generate_password_hash, password).decode('utf-8')
+
+def verificar_hash(password_hash, password):
+    return ejecutar_hash('verificar', bcrypt.check_password_hash, password_hash, password)
+
+def coste_hash(password_hash):
+    # Formato $2b$12$...: el segundo campo es el log2 de las rondas.
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+@app.errorhandler(HashSaturadoError)
+def hash_saturado(error):
+    respuesta = Response('Hay demasiados inicios de sesión en curso. Inténtalo de nuevo en unos segundos.\n',
+                         status=503, mimetype='text/plain')
+    respuesta.headers['Retry-After'] = str(HASH_RETRY_AFTER)
+    return respuesta
 
 # --- Rutas de Autenticación ---
 @app.route('/register', methods=['GET', 'POST'])
@@ -191,7 +1814,7 @@ def register():
             conn.close()
             return redirect(url_for('login'))
         
-        hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        hashed_password = generar_hash(password)
         try:
             cursor.execute("INSERT INTO users (email, password_hash) VALUES (%s, %s) RETURNING id", (email, hashed_password))
             new_user_id = cursor.fetchone()['id']
@@ -220,14 +1843,26 @@ def login():
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
         user_db = cursor.fetchone()
-        conn.close()
         
-        if user_db and bcrypt.check_password_hash(user_db['password_hash'], password):
+        if user_db and verificar_hash(user_db['password_hash'], password):
+            if coste_hash(user_db['password_hash']) != BCRYPT_LOG_ROUNDS:
+                # Rehash transparente al nuevo coste; si el pool está lleno se deja para el próximo login.
+                try:
+                    cursor.execute("UPDATE users SET password_hash = %s WHERE id = %s",
+                                   (generar_hash(password), user_db['id']))
+                    conn.commit()
+                except HashSaturadoError:
+                    pass
+            cursor.close()
+            conn.close()
             user_obj = User(id=user_db['id'], email=user_db['email'])
             login_user(user_obj, remember=True)
+            recordar_usuario_en_sesion(user_obj)
             next_page = request.args.get('next')
             return redirect(next_page or url_for('index'))
         else:
+            cursor.close()
+            conn.close()
             flash('Email o contraseña incorrectos. Por favor, inténtalo de nuevo.', 'danger')
             return redirect(url_for('login'))
 
@@ -237,6 +1872,7 @@ def login():
 @login_required
 def logout():
     logout_user()
+    olvidar_usuario_en_sesion()
     flash('Has cerrado sesión.', 'success')
     return redirect(url_for('login'))
 
@@ -259,6 +1895,7 @@ def index():
                 "INSERT INTO transacciones (fecha, descripcion, monto, tipo, categoria, user_id) VALUES (%s, %s, %s, %s, %s, %s)",
                 (fecha, descripcion, monto, tipo, categoria, user_id)
             )
+            actualizar_agregados(cursor, [(user_id, fecha, tipo, categoria, monto, 1)])
             conn.commit()
         except Exception as e:
             print(f"An error occurred while inserting data: {e}")
@@ -271,54 +1908,56 @@ def index():
     today = datetime.date.today()
     mes_seleccionado = request.args.get('mes', f"{today.month:02d}")
     ano_seleccionado = request.args.get('ano', str(today.year))
+
+    # Caché de la página renderizada. Se salta si hay mensajes flash pendientes,
+    # porque se muestran una sola vez y forman parte del HTML.
+    inicio_render = time.perf_counter()
+    clave_pagina = None
+    if PAGE_CACHE_ENABLED and '_flashes' not in session:
+        clave_pagina = (user_id, request.full_path, leer_version_datos(cursor, user_id), today.isoformat())
+        en_cache = page_cache.get_pagina(clave_pagina)
+        if en_cache:
+            cursor.close()
+            conn.close()
+            respuesta = make_response(en_cache[0])
+            respuesta.headers['X-Page-Cache'] = f"HIT; saved={en_cache[1]:.1f}ms"
+            return respuesta
     
-    filtro_mensual_sql_where = " WHERE to_char(fecha, 'YYYY') = %s AND to_char(fecha, 'MM') = %s AND user_id = %s "
-    filtro_mensual_sql_and = " AND to_char(fecha, 'YYYY') = %s AND to_char(fecha, 'MM') = %s AND user_id = %s "
-    params_mensual = (ano_seleccionado, mes_seleccionado, user_id)
-    
+    datos_ok = False
     progreso_presupuestos = []
     transacciones = []
+    siguiente_cursor = None
     balance_mensual, ingresos_mensual, gastos_mensual = 0.0, 0.0, 0.0
     balance_historico = 0.0
     
     try:
-        cursor.execute("SELECT * FROM transacciones" + filtro_mensual_sql_where + "ORDER BY fecha DESC, id DESC", params_mensual)
-        transacciones = cursor.fetchall()
-        cursor.execute("SELECT COALESCE(SUM(monto), 0) FROM transacciones WHERE tipo = 'ingreso'" + filtro_mensual_sql_and, params_mensual)
-        ingresos_mensual = cursor.fetchone()[0]
-        cursor.execute("SELECT COALESCE(SUM(monto), 0) FROM transacciones WHERE tipo = 'gasto'" + filtro_mensual_sql_and, params_mensual)
-        gastos_mensual = cursor.fetchone()[0]
-        balance_mensual = ingresos_mensual - gastos_mensual
-
-        cursor.execute("SELECT COALESCE(SUM(monto), 0) FROM transacciones WHERE tipo = 'ingreso' AND user_id = %s", (user_id,))
-        total_ingresos_historico = cursor.fetchone()[0]
-        cursor.execute("SELECT COALESCE(SUM(monto), 0) FROM transacciones WHERE tipo = 'gasto' AND user_id = %s", (user_id,))
-        total_gastos_historico = cursor.fetchone()[0]
-        balance_historico = total_ingresos_historico - total_gastos_historico
-        
+        # Sólo la primera página; el resto lo pide la tabla al hacer scroll.
+        transacciones, siguiente_cursor = listar_transacciones(
+            cursor, user_id, ano_seleccionado, mes_seleccionado, TRANSACCIONES_POR_PAGINA
+        )
+        # Totales del mes e históricos leídos de los balances mantenidos.
         cursor.execute(
-            "SELECT categoria, SUM(monto) as total_gastado "
-            "FROM transacciones "
-            "WHERE tipo = 'gasto'" + filtro_mensual_sql_and +
-            "GROUP BY categoria",
-            params_mensual
+            "SELECT bu.ingresos AS ingresos_historico, bu.gastos AS gastos_historico, "
+            "COALESCE(bm.ingresos, 0) AS ingresos_mensual, COALESCE(bm.gastos, 0) AS gastos_mensual "
+            "FROM balance_usuario bu "
+            "LEFT JOIN balance_mensual bm ON bm.user_id = bu.user_id AND bm.ano = %s AND bm.mes = %s "
+            "WHERE bu.user_id = %s",
+            (int(ano_seleccionado), int(mes_seleccionado), user_id)
         )
-        gastos_reales = {row['categoria']: row['total_gastado'] for row in cursor.fetchall()}
-
-        cursor.execute("SELECT categoria, monto_maximo FROM presupuestos WHERE user_id = %s", (user_id,))
-        presupuestos_fijados = {row['categoria']: row['monto_maximo'] for row in cursor.fetchall()}
-
-        cursor.execute("SELECT nombre FROM categorias WHERE user_id = %s ORDER BY nombre ASC", (user_id,))
-        categorias_db = [row['nombre'] for row in cursor.fetchall()]
+        resumen = cursor.fetchone()
+        if resumen:
+            ingresos_mensual = resumen['ingresos_mensual']
+            gastos_mensual = resumen['gastos_mensual']
+            balance_historico = resumen['ingresos_historico'] - resumen['gastos_historico']
+        else:
+            ingresos_mensual, gastos_mensual = 0, 0
+        balance_mensual = ingresos_mensual - gastos_mensual
 
-        for cat in categorias_db: 
-            gastado = gastos_reales.get(cat, 0)
-            presupuesto = presupuestos_fijados.get(cat, 0)
-            if presupuesto > 0:
-                porcentaje, porcentaje_real = min(round((float(gastado) / float(presupuesto)) * 100), 100), round((float(gastado) / float(presupuesto)) * 100)
-            else:
-                porcentaje, porcentaje_real = 0, 0
-            progreso_presupuestos.append({'categoria': cat, 'gastado': gastado, 'presupuesto': presupuesto, 'porcentaje': porcentaje, 'porcentaje_real': porcentaje_real})
+        # Estado de presupuestos precalculado (categorías, límite y gastado del mes).
+        progreso_presupuestos = leer_estado_presupuestos(cursor, user_id, ano_seleccionado, mes_seleccionado)
+        # El context processor reutiliza la lista en vez de volver a consultarla.
+        g.categorias_usuario = [item['categoria'] for item in progreso_presupuestos]
+        datos_ok = True
 
     except Exception as e:
         print(f"An error occurred while fetching data: {e}")
@@ -331,17 +1970,10 @@ def index():
     else:
         default_form_date = f"{ano_seleccionado}-{mes_seleccionado}-01"
     
-    nombres_meses_default = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
-    if not set_locale(): nombres_meses = nombres_meses_default
-    else:
-        try: nombres_meses = list(calendar.month_name)[1:]
-        except Exception: nombres_meses = nombres_meses_default
-
-    meses_del_ano = [{"val": f"{i:02d}", "nom": nombres_meses[i-1]} for i in range(1, 13)]
-    anos_disponibles = list(range(today.year - 5, today.year + 2))
     
-    return render_template('index.html', 
+    html = render_template('index.html', 
                            transacciones=transacciones, 
+                           siguiente_cursor=siguiente_cursor,
                            balance_mensual=balance_mensual,
                            ingresos_mensual=ingresos_mensual,
                            gastos_mensual=gastos_mensual,
@@ -349,10 +1981,15 @@ def index():
                            default_form_date=default_form_date,
                            mes_seleccionado=mes_seleccionado,
                            ano_seleccionado=ano_seleccionado,
-                           meses_del_ano=meses_del_ano,
-                           anos_disponibles=anos_disponibles,
+                           meses_del_ano=MESES_DEL_ANO,
+                           anos_disponibles=anos_disponibles(today.year),
                            progreso_presupuestos=progreso_presupuestos
                            )
+    respuesta = make_response(html)
+    if clave_pagina and datos_ok:
+        page_cache.set(clave_pagina, (html, (time.perf_counter() - inicio_render) * 1000))
+        respuesta.headers['X-Page-Cache'] = 'MISS'
+    return respuesta
 
 @app.route('/presupuestos', methods=['GET', 'POST'])
 @login_required
@@ -365,6 +2002,16 @@ def presupuestos():
         try:
             categoria = request.form['categoria']
             monto_maximo = float(request.form['monto_maximo'])
+            hoy = datetime.date.today()
+            cursor.execute(
+                "SELECT COALESCE(p.monto_maximo, 0) AS presupuesto, COALESCE(e.gastado, 0) AS gastado "
+                "FROM categorias c "
+                "LEFT JOIN presupuestos p ON p.user_id = c.user_id AND p.categoria = c.nombre "
+                "LEFT JOIN estado_presupuestos e ON e.user_id = c.user_id AND e.ano = %s AND e.mes = %s AND e.categoria = c.nombre "
+                "WHERE c.user_id = %s AND c.nombre = %s",
+                (hoy.year, hoy.month, user_id, categoria)
+            )
+            actual = cursor.fetchone()
             cursor.execute(
                 """
                 INSERT INTO presupuestos (categoria, monto_maximo, user_id)
@@ -374,7 +2021,14 @@ def presupuestos():
                 """,
                 (categoria, monto_maximo, user_id)
             )
+            if actual:
+                # Bajar el límite también puede cruzar un umbral en el mes en curso.
+                gastado = float(actual['gastado'])
+                emitir_cruces_umbral(cursor, user_id, hoy.year, hoy.month, categoria,
+                                     gastado, gastado, float(actual['presupuesto']), monto_maximo)
+            incrementar_version_datos(cursor, [user_id])
             conn.commit()
+            invalidar_cache_usuario(user_id)
         except Exception as e:
             print(f"Error al guardar presupuesto: {e}")
         finally:
@@ -382,172 +2036,968 @@ def presupuestos():
             conn.close()
         return redirect(url_for('presupuestos'))
 
-    presupuestos_guardados = []
-    try:
-        cursor.execute("SELECT categoria, monto_maximo FROM presupuestos WHERE user_id = %s ORDER BY categoria", (user_id,))
-        presupuestos_guardados = cursor.fetchall()
-    except Exception as e:
-        print(f"Error al leer presupuestos: {e}")
-    
+    presupuestos_dict = {}
+    try:
+        presupuestos_dict = get_presupuestos_usuario(user_id)
+    except Exception as e:
+        print(f"Error al leer presupuestos: {e}")
+    
+    cursor.close()
+    conn.close()
+    return render_template('presupuestos.html', 
+                           presupuestos_guardados=presupuestos_dict
+                           )
+
+@app.route('/configuracion', methods=['GET', 'POST'])
+@login_required
+def configuracion():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    user_id = current_user.id
+
+    if request.method == 'POST':
+        categoria_nueva = request.form.get('nombre_categoria', '').strip()
+        if categoria_nueva:
+            try:
+                cursor.execute("INSERT INTO categorias (nombre, user_id) VALUES (%s, %s)", (categoria_nueva, user_id))
+                incrementar_version_datos(cursor, [user_id])
+                conn.commit()
+                invalidar_cache_usuario(user_id)
+            except Exception as e:
+                conn.rollback()
+                if 'UNIQUE constraint' in str(e) or 'duplicate key' in str(e):
+                    flash(f"La categoría '{categoria_nueva}' ya existe.", 'warning')
+                else:
+                    flash(f"Error al insertar categoría: {e}", 'danger')
+        cursor.close()
+        conn.close()
+        return redirect(url_for('configuracion'))
+
+    cursor.execute(
+        "SELECT id, descripcion, monto, tipo, categoria, frecuencia, dia, proxima_fecha, activa "
+        "FROM transacciones_recurrentes WHERE user_id = %s ORDER BY proxima_fecha, id",
+        (user_id,)
+    )
+    recurrentes = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return render_template('configuracion.html', recurrentes=recurrentes, hoy=datetime.date.today().isoformat())
+
+@app.route('/configuracion/delete', methods=['POST'])
+@login_required
+def delete_categoria():
+    categoria_a_borrar = request.form.get('categoria')
+    user_id = current_user.id
+    
+    if categoria_a_borrar == 'Otros':
+        flash("No se puede borrar la categoría 'Otros'.", 'warning')
+        return redirect(url_for('configuracion'))
+    if not categoria_a_borrar:
+         return redirect(url_for('configuracion'))
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        fusionar_categorias(cursor, user_id, [categoria_a_borrar], 'Otros', fusionar_presupuestos=False)
+        conn.commit()
+        invalidar_cache_usuario(user_id)
+        flash(f"Categoría '{categoria_a_borrar}' eliminada.", 'success')
+    except Exception as e:
+        conn.rollback()
+        flash(f"Error al eliminar categoría: {e}", 'danger')
+    finally:
+        cursor.close()
+        conn.close()
+    
+    return redirect(url_for('configuracion'))
+
+@app.route('/configuracion/fusionar', methods=['POST'])
+@login_required
+def fusionar_categoria():
+    # Renombrar es fusionar una sola categoría en un nombre nuevo.
+    user_id = current_user.id
+    existentes = set(get_categorias_usuario(user_id))
+    origenes = [o for o in request.form.getlist('origenes') if o in existentes]
+    destino = request.form.get('destino', '').strip()
+
+    if not origenes or not destino:
+        flash("Elige al menos una categoría y el nombre de destino.", 'warning')
+        return redirect(url_for('configuracion'))
+    if 'Otros' in origenes:
+        flash("No se puede renombrar ni fusionar la categoría 'Otros'.", 'warning')
+        return redirect(url_for('configuracion'))
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        fusionar_categorias(cursor, user_id, origenes, destino)
+        conn.commit()
+        invalidar_cache_usuario(user_id)
+        flash(f"{', '.join(origenes)} → '{destino}'.", 'success')
+    except Exception as e:
+        conn.rollback()
+        flash(f"Error al fusionar categorías: {e}", 'danger')
+    finally:
+        cursor.close()
+        conn.close()
+
+    return redirect(url_for('configuracion'))
+
+@app.route('/reportes')
+@login_required
+def reportes():
+    today = datetime.date.today()
+    mes_seleccionado = request.args.get('mes', f"{today.month:02d}")
+    ano_seleccionado = request.args.get('ano', str(today.year))
+
+
+    return render_template('reportes.html',
+                           mes_seleccionado=mes_seleccionado,
+                           ano_seleccionado=ano_seleccionado,
+                           meses_del_ano=MESES_DEL_ANO,
+                           anos_disponibles=anos_disponibles(today.year))
+
+@app.route('/delete/<int:id>', methods=['POST'])
+@login_required
+def delete(id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    user_id = current_user.id
+    try:
+        cursor.execute(
+            "DELETE FROM transacciones WHERE id = %s AND user_id = %s RETURNING fecha, tipo, categoria, monto",
+            (id, user_id)
+        )
+        borrada = cursor.fetchone()
+        if borrada:
+            actualizar_agregados(cursor, [(user_id, borrada['fecha'], borrada['tipo'], borrada['categoria'], borrada['monto'], -1)])
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+    finally:
+        cursor.close()
+        conn.close()
+        return redirect(request.referrer or url_for('index'))
+
+@app.route('/update/<int:id>', methods=['POST'])
+@login_required
+def update(id):
+    if request.method == 'POST':
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        user_id = current_user.id
+        try:
+            cursor.execute(
+                "SELECT fecha, tipo, categoria, monto FROM transacciones WHERE id = %s AND user_id = %s" + SQL_FOR_UPDATE,
+                (id, user_id)
+            )
+            anterior = cursor.fetchone()
+            if anterior:
+                fecha = request.form['edit-fecha']
+                descripcion = request.form['edit-descripcion']
+                monto = float(request.form['edit-monto'])
+                tipo = request.form['edit-tipo']
+                categoria = request.form.get('edit-categoria', 'Otros') if tipo == 'gasto' else 'Ingreso'
+                
+                cursor.execute(
+                    """
+                    UPDATE transacciones SET fecha = %s, descripcion = %s, monto = %s, tipo = %s, categoria = %s
+                    WHERE id = %s AND user_id = %s
+                    """,
+                    (fecha, descripcion, monto, tipo, categoria, id, user_id)
+                )
+                actualizar_agregados(cursor, [
+                    (user_id, anterior['fecha'], anterior['tipo'], anterior['categoria'], anterior['monto'], -1),
+                    (user_id, fecha, tipo, categoria, monto, 1),
+                ])
+                conn.commit()
+            else:
+                flash("Error: No tienes permiso para editar esta transacción.", 'danger')
+        except Exception as e:
+            conn.rollback()
+        finally:
+            cursor.close()
+            conn.close()
+        return redirect(request.referrer or url_for('index'))
+
+
+@app.route('/api/transacciones')
+@login_required
+def transacciones_api():
+    today = datetime.date.today()
+    mes = request.args.get('mes', f"{today.month:02d}")
+    ano = request.args.get('ano', str(today.year))
+    try:
+        limite = min(int(request.args.get('limite', TRANSACCIONES_POR_PAGINA)), TRANSACCIONES_POR_PAGINA_MAX)
+        despues = leer_cursor_transacciones(request.args['cursor']) if request.args.get('cursor') else None
+        rango_mensual(ano, mes)
+    except ValueError:
+        return jsonify({'error': 'Parámetros inválidos.'}), 400
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    filas, siguiente_cursor = listar_transacciones(cursor, current_user.id, ano, mes, max(limite, 1), despues)
+    cursor.close()
+    conn.close()
+    return jsonify({
+        'transacciones': [transaccion_a_json(f) for f in filas],
+        'siguiente_cursor': siguiente_cursor,
+    })
+
+# --- Búsqueda ---
+# Postgres usa un índice GIN sobre to_tsvector('simple', descripcion) (sin
+# stemming: son nombres de comercios). SQLite usa transacciones_fts, una tabla
+# FTS5 de contenido externo que mantienen los triggers de la migración 6, así
+# que cualquier escritura (formulario, edición, importación, recurrentes) la
+# actualiza. En FTS5 también se indexa user_id para filtrar dentro del índice.
+BUSQUEDA_MAX_TERMINOS = 8
+BUSQUEDA_MAX_CANDIDATOS = int(os.environ.get('SEARCH_MAX_CANDIDATES', 1000))
+TSVECTOR_DESCRIPCION = "to_tsvector('simple', descripcion)"
+
+def terminos_busqueda(texto):
+    return re.findall(r"[^\W_]+", texto.lower())[:BUSQUEDA_MAX_TERMINOS]
+
+def buscar_transacciones(cursor, user_id, terminos, limite, despues=None):
+    """Busca transacciones cuya descripción contenga todos los términos.
+
+    Como al escribir sólo la última palabra está a medias, ésa se busca como
+    prefijo y las anteriores como palabras completas (el prefijo de una palabra
+    muy común obliga a recorrer muchas más entradas del índice).
+
+    Devuelve (filas, siguiente_cursor) de la más a la menos relevante; a igual
+    relevancia, de la más nueva a la más vieja. `despues` es (rango, fecha, id)
+    de la última fila entregada. Sólo se ordenan por relevancia las
+    BUSQUEDA_MAX_CANDIDATOS coincidencias más recientes (por id): calcular el
+    rango de todas hace que un prefijo corto tarde lo que tarda leer la cuenta.
+    """
+    if DATABASE_URL:
+        sql = (
+            "SELECT * FROM (SELECT id, fecha, descripcion, monto, tipo, categoria, "
+            f"CAST(ts_rank({TSVECTOR_DESCRIPCION}, q) AS DOUBLE PRECISION) AS rango FROM ("
+            "SELECT t.*, q FROM transacciones t, to_tsquery('simple', %s) q "
+            f"WHERE t.user_id = %s AND {TSVECTOR_DESCRIPCION} @@ q ORDER BY t.id DESC LIMIT %s"
+            ") c) r"
+        )
+        params = [" & ".join(terminos[:-1] + [f"{terminos[-1]}:*"]), user_id, BUSQUEDA_MAX_CANDIDATOS]
+    else:
+        sql = (
+            "SELECT * FROM (SELECT t.id, t.fecha, t.descripcion, t.monto, t.tipo, t.categoria, c.rango FROM ("
+            "SELECT rowid, -bm25(transacciones_fts, 1.0, 0.0) AS rango FROM transacciones_fts "
+            "WHERE transacciones_fts MATCH %s ORDER BY rowid DESC LIMIT %s"
+            ") c JOIN transacciones t ON t.id = c.rowid WHERE t.user_id = %s) r"
+        )
+        consulta = " AND ".join([f'descripcion : "{termino}"' for termino in terminos[:-1]] +
+                                [f'descripcion : "{terminos[-1]}"*', f'user_id : "{int(user_id)}"'])
+        params = [consulta, BUSQUEDA_MAX_CANDIDATOS, user_id]
+    if despues is not None:
+        sql += " WHERE rango < %s OR (rango = %s AND (fecha, id) < (%s, %s))"
+        params.extend((despues[0], *despues))
+    sql += " ORDER BY rango DESC, fecha DESC, id DESC LIMIT %s"
+    params.append(limite + 1)
+    cursor.execute(sql, params)
+    filas = cursor.fetchall()
+    siguiente_cursor = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        ultima = filas[-1]
+        siguiente_cursor = f"{float(ultima['rango'])!r}_{a_fecha(ultima['fecha']).isoformat()}_{ultima['id']}"
+    return filas, siguiente_cursor
+
+def leer_cursor_busqueda(valor):
+    rango, fecha, id_ = valor.rsplit('_', 2)
+    return float(rango), datetime.date.fromisoformat(fecha).isoformat(), int(id_)
+
+@app.route('/api/transacciones/buscar')
+@login_required
+def buscar_transacciones_api():
+    terminos = terminos_busqueda(request.args.get('q', ''))
+    try:
+        limite = min(int(request.args.get('limite', TRANSACCIONES_POR_PAGINA)), TRANSACCIONES_POR_PAGINA_MAX)
+        despues = leer_cursor_busqueda(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError:
+        return jsonify({'error': 'Parámetros inválidos.'}), 400
+    if not terminos:
+        return jsonify({'transacciones': [], 'siguiente_cursor': None})
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    filas, siguiente_cursor = buscar_transacciones(cursor, current_user.id, terminos, max(limite, 1), despues)
+    cursor.close()
+    conn.close()
+    return jsonify({
+        'transacciones': [transaccion_a_json(f) for f in filas],
+        'siguiente_cursor': siguiente_cursor,
+    })
+
+# --- Exportación ---
+COLUMNAS_EXPORTACION = ('id', 'fecha', 'descripcion', 'monto', 'tipo', 'categoria')
+
+def iterar_transacciones_exportacion(user_id, ano=None, mes=None):
+    """Recorre las transacciones del usuario sin cargarlas todas en memoria.
+
+    En Postgres usa un cursor con nombre (del lado del servidor) que trae
+    EXPORT_BATCH_SIZE filas por viaje; en SQLite basta con ir haciendo fetchmany.
+    """
+    sql = "SELECT id, fecha, descripcion, monto, tipo, categoria FROM transacciones WHERE user_id = %s"
+    params = [user_id]
+    if ano and mes:
+        sql += " AND fecha >= %s AND fecha < %s"
+        params.extend(rango_mensual(ano, mes))
+    elif ano:
+        sql += " AND fecha >= %s AND fecha < %s"
+        params.extend(rango_anual(ano))
+    sql += " ORDER BY fecha, id"
+
+    conn = get_db_connection()
+    if DATABASE_URL:
+        cursor = conn.cursor(name=f"export_{uuid.uuid4().hex}")
+        cursor.itersize = EXPORT_BATCH_SIZE
+    else:
+        cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params)
+        while True:
+            filas = cursor.fetchmany(EXPORT_BATCH_SIZE)
+            if not filas:
+                break
+            for fila in filas:
+                yield (fila['id'], a_fecha(fila['fecha']).isoformat(), fila['descripcion'],
+                       f"{fila['monto']:.2f}", fila['tipo'], fila['categoria'])
+    finally:
+        cursor.close()
+
+def generar_csv(filas):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNAS_EXPORTACION)
+    for fila in filas:
+        writer.writerow(fila)
+        if buffer.tell() >= 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def generar_ndjson(filas):
+    lote = []
+    for fila in filas:
+        lote.append(json.dumps(dict(zip(COLUMNAS_EXPORTACION, fila)), ensure_ascii=False))
+        if len(lote) >= 500:
+            yield "\n".join(lote) + "\n"
+            lote = []
+    if lote:
+        yield "\n".join(lote) + "\n"
+
+@app.route('/export/transacciones.<formato>')
+@login_required
+def exportar_transacciones(formato):
+    if formato not in ('csv', 'ndjson'):
+        return jsonify({'error': 'Formato no soportado.'}), 404
+    ano = request.args.get('ano')
+    mes = request.args.get('mes')
+    try:
+        if ano and mes:
+            rango_mensual(ano, mes)
+        elif ano:
+            rango_anual(ano)
+    except ValueError:
+        return jsonify({'error': 'Parámetros inválidos.'}), 400
+
+    sufijo = f"_{ano}" + (f"_{mes}" if mes else "") if ano else ""
+    filas = iterar_transacciones_exportacion(current_user.id, ano, mes)
+    generador, mimetype = (generar_csv, 'text/csv') if formato == 'csv' else (generar_ndjson, 'application/x-ndjson')
+    # stream_with_context mantiene vivo el contexto (y con él la conexión prestada) mientras se envía.
+    return Response(
+        stream_with_context(generador(filas)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=transacciones{sufijo}.{formato}'}
+    )
+
+# --- Importación ---
+def validar_fila_importacion(fila, categorias):
+    """Convierte una fila del CSV en (fecha, descripcion, monto, tipo, categoria) o lanza ValueError."""
+    try:
+        fecha = datetime.date.fromisoformat((fila.get('fecha') or '').strip())
+    except ValueError:
+        raise ValueError(f"fecha inválida '{fila.get('fecha')}'")
+    descripcion = (fila.get('descripcion') or '').strip()
+    if not descripcion or len(descripcion) > 255:
+        raise ValueError("descripción vacía o de más de 255 caracteres")
+    try:
+        monto = round(float((fila.get('monto') or '').strip()), 2)
+    except ValueError:
+        raise ValueError(f"monto inválido '{fila.get('monto')}'")
+    if monto <= 0:
+        raise ValueError("el monto debe ser positivo")
+    tipo = (fila.get('tipo') or '').strip().lower()
+    if tipo not in ('ingreso', 'gasto'):
+        raise ValueError(f"tipo inválido '{fila.get('tipo')}'")
+    if tipo == 'gasto':
+        categoria = (fila.get('categoria') or '').strip() or 'Otros'
+        if categoria not in categorias:
+            raise ValueError(f"la categoría '{categoria}' no existe")
+    else:
+        categoria = 'Ingreso'
+    return fecha, descripcion, monto, tipo, categoria
+
+def cargar_lote_transacciones(cursor, user_id, filas):
+    if DATABASE_URL:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for fecha, descripcion, monto, tipo, categoria in filas:
+            writer.writerow((user_id, fecha.isoformat(), descripcion, f"{monto:.2f}", tipo, categoria))
+        buffer.seek(0)
+        cursor.copy_expert(
+            "COPY transacciones (user_id, fecha, descripcion, monto, tipo, categoria) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    else:
+        cursor.executemany(
+            "INSERT INTO transacciones (user_id, fecha, descripcion, monto, tipo, categoria) VALUES (%s, %s, %s, %s, %s, %s)",
+            [(user_id, fecha.isoformat(), descripcion, monto, tipo, categoria) for fecha, descripcion, monto, tipo, categoria in filas]
+        )
+    actualizar_agregados(cursor, [(user_id, fecha, tipo, categoria, monto, 1) for fecha, _, monto, tipo, categoria in filas])
+
+def importar_transacciones(conn, user_id, archivo):
+    """Importa un CSV (fecha, descripcion, monto, tipo[, categoria]) leyéndolo como stream.
+
+    Las filas inválidas se reportan y se saltan; las válidas se cargan por lotes
+    de IMPORT_BATCH_SIZE dentro de una sola transacción. Cada lote va en un
+    SAVEPOINT, así un lote que falla en la BD no tira abajo los demás.
+    """
+    inicio = time.perf_counter()
+    resultado = {'importadas': 0, 'errores': []}
+    lector = csv.DictReader(archivo)
+    faltantes = {'fecha', 'descripcion', 'monto', 'tipo'} - set(lector.fieldnames or [])
+    if faltantes:
+        resultado['errores'].append((1, f"faltan columnas: {', '.join(sorted(faltantes))}"))
+        return resultado
+
+    categorias = set(get_categorias_usuario(user_id))
+    cursor = conn.cursor()
+
+    def cargar(lote, primera_linea):
+        cursor.execute("SAVEPOINT lote_importacion")
+        try:
+            cargar_lote_transacciones(cursor, user_id, lote)
+            cursor.execute("RELEASE SAVEPOINT lote_importacion")
+            resultado['importadas'] += len(lote)
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT lote_importacion")
+            resultado['errores'].append((primera_linea, f"lote de {len(lote)} filas descartado: {e}"))
+
+    lote, primera_linea = [], 2
+    for fila in lector:
+        try:
+            lote.append(validar_fila_importacion(fila, categorias))
+        except ValueError as e:
+            resultado['errores'].append((lector.line_num, str(e)))
+        if len(lote) >= IMPORT_BATCH_SIZE:
+            cargar(lote, primera_linea)
+            lote, primera_linea = [], lector.line_num + 1
+    if lote:
+        cargar(lote, primera_linea)
+    conn.commit()
+    cursor.close()
+
+    resultado['segundos'] = round(time.perf_counter() - inicio, 3)
+    resultado['filas_por_segundo'] = round(resultado['importadas'] / resultado['segundos']) if resultado['segundos'] else 0
+    return resultado
+
+@app.route('/importar', methods=['POST'])
+@login_required
+def importar():
+    archivo = request.files.get('archivo')
+    if not archivo or not archivo.filename:
+        flash('Selecciona un archivo CSV para importar.', 'warning')
+        return redirect(url_for('configuracion'))
+
+    conn = get_db_connection()
+    try:
+        resultado = importar_transacciones(conn, current_user.id, io.TextIOWrapper(archivo.stream, encoding='utf-8-sig'))
+    except Exception as e:
+        conn.rollback()
+        flash(f'Error al importar: {e}', 'danger')
+        return redirect(url_for('configuracion'))
+    finally:
+        conn.close()
+
+    flash(f"Importadas {resultado['importadas']} transacciones en {resultado.get('segundos', 0)} s "
+          f"({resultado.get('filas_por_segundo', 0)} filas/s).", 'success' if resultado['importadas'] else 'warning')
+    for linea, mensaje in resultado['errores'][:20]:
+        flash(f"Línea {linea}: {mensaje}", 'danger')
+    if len(resultado['errores']) > 20:
+        flash(f"... y {len(resultado['errores']) - 20} errores más.", 'danger')
+    return redirect(url_for('configuracion'))
+
+# --- Escritura por lotes ---
+# POST /api/transacciones/lote recibe {"operaciones": [...], "atomico": false},
+# donde cada operación es {"op": "crear", fecha, descripcion, monto, tipo, categoria},
+# {"op": "actualizar", "id", ...los mismos campos} o {"op": "borrar", "id"}.
+# Todo se valida antes de escribir (las categorías salen de una sola lectura),
+# y luego se aplica en una transacción con una sentencia multi-fila por tipo de
+# operación. Las operaciones inválidas se informan por ítem y se saltan, salvo
+# con "atomico": true, donde cualquier error deja el lote sin aplicar.
+LOTE_MAX_OPERACIONES = int(os.environ.get('BATCH_MAX_OPERATIONS', 500))
+OPERACIONES_LOTE = ('crear', 'actualizar', 'borrar')
+
+def validar_operacion_lote(operacion, categorias):
+    """Devuelve (op, id, campos) o lanza ValueError; `campos` es None al borrar."""
+    if not isinstance(operacion, dict):
+        raise ValueError("cada operación debe ser un objeto")
+    op = operacion.get('op')
+    if op not in OPERACIONES_LOTE:
+        raise ValueError(f"op inválida '{op}' (se espera {', '.join(OPERACIONES_LOTE)})")
+    id_ = None
+    if op != 'crear':
+        id_ = operacion.get('id')
+        if not isinstance(id_, int) or isinstance(id_, bool):
+            raise ValueError("falta el id de la transacción")
+    if op == 'borrar':
+        return op, id_, None
+    # Mismas reglas que la importación CSV, que trabaja con textos.
+    fila = {clave: '' if valor is None else str(valor) for clave, valor in operacion.items()}
+    return op, id_, validar_fila_importacion(fila, categorias)
+
+def parametros_fila_lote(campos):
+    fecha, descripcion, monto, tipo, categoria = campos
+    # psycopg2 manda las fechas tipadas (::date); a SQLite se le pasan como texto ISO.
+    return (fecha if DATABASE_URL else fecha.isoformat(), descripcion, monto, tipo, categoria)
+
+def insertar_lote_transacciones(cursor, user_id, filas):
+    """Inserta todas las filas en una sentencia y devuelve sus ids en el mismo orden.
+
+    Los ids salen de la secuencia fila a fila en el orden de VALUES, así que
+    ordenados coinciden con las filas aunque RETURNING no garantice el orden.
+    """
+    valores = [(user_id, *parametros_fila_lote(campos)) for campos in filas]
+    sql = "INSERT INTO transacciones (user_id, fecha, descripcion, monto, tipo, categoria) VALUES {} RETURNING id"
+    if DATABASE_URL:
+        devueltas = psycopg2.extras.execute_values(cursor, sql.format('%s'), valores, page_size=len(valores), fetch=True)
+    else:
+        cursor.execute(sql.format(", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(valores))),
+                       [valor for fila in valores for valor in fila])
+        devueltas = cursor.fetchall()
+    return sorted(fila['id'] for fila in devueltas)
+
+def actualizar_lote_transacciones(cursor, user_id, cambios):
+    # UPDATE ... FROM (VALUES ...): las columnas del VALUES se llaman column1..N
+    # tanto en Postgres como en SQLite (>= 3.33). El user_id viaja en cada fila
+    # para que la sentencia tenga un único marcador, como pide execute_values.
+    valores = [(id_, *parametros_fila_lote(campos), user_id) for id_, campos in cambios]
+    sql = ("UPDATE transacciones SET fecha = v.column2, descripcion = v.column3, monto = v.column4, "
+           "tipo = v.column5, categoria = v.column6 FROM (VALUES {}) AS v "
+           "WHERE transacciones.id = v.column1 AND transacciones.user_id = v.column7")
+    if DATABASE_URL:
+        psycopg2.extras.execute_values(cursor, sql.format('%s'), valores, page_size=len(valores))
+    else:
+        cursor.execute(sql.format(", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(valores))),
+                       [valor for fila in valores for valor in fila])
+
+def aplicar_lote_transacciones(conn, user_id, operaciones, atomico=False):
+    """Valida y aplica un lote de operaciones; devuelve (resultados, aplicado).
+
+    `resultados` tiene un ítem por operación, en el orden recibido. `aplicado`
+    es False sólo si el lote era atómico y alguna operación falló.
+    """
+    categorias = set(get_categorias_usuario(user_id))
+    resultados, validas, ids_vistos = [], [], set()
+    for indice, operacion in enumerate(operaciones):
+        resultado = {'indice': indice, 'op': operacion.get('op') if isinstance(operacion, dict) else None}
+        resultados.append(resultado)
+        try:
+            op, id_, campos = validar_operacion_lote(operacion, categorias)
+            if id_ is not None:
+                resultado['id'] = id_
+                if id_ in ids_vistos:
+                    raise ValueError(f"la transacción {id_} aparece más de una vez en el lote")
+                ids_vistos.add(id_)
+            validas.append((resultado, op, id_, campos))
+        except ValueError as e:
+            resultado.update(estado='error', error=str(e))
+
+    cursor = conn.cursor()
+    anteriores = {}
+    if ids_vistos:
+        cursor.execute(
+            "SELECT id, fecha, tipo, categoria, monto FROM transacciones WHERE user_id = %s AND id IN (" +
+            ", ".join(["%s"] * len(ids_vistos)) + ")" + SQL_FOR_UPDATE,
+            [user_id, *ids_vistos]
+        )
+        anteriores = {fila['id']: fila for fila in cursor.fetchall()}
+    for resultado, op, id_, campos in validas:
+        if id_ is not None and id_ not in anteriores:
+            resultado.update(estado='error', error=f"la transacción {id_} no existe")
+    validas = [v for v in validas if 'estado' not in v[0]]
+
+    if atomico and len(validas) < len(operaciones):
+        for resultado, *_ in validas:
+            resultado['estado'] = 'no_aplicada'
+        cursor.close()
+        conn.rollback()
+        return resultados, False
+
+    creaciones = [(resultado, campos) for resultado, op, _, campos in validas if op == 'crear']
+    cambios = [(resultado, id_, campos) for resultado, op, id_, campos in validas if op == 'actualizar']
+    borrados = [(resultado, id_) for resultado, op, id_, _ in validas if op == 'borrar']
+    movimientos = []
+    if creaciones:
+        ids = insertar_lote_transacciones(cursor, user_id, [campos for _, campos in creaciones])
+        for (resultado, campos), id_ in zip(creaciones, ids):
+            fecha, _, monto, tipo, categoria = campos
+            resultado.update(estado='creada', id=id_)
+            movimientos.append((user_id, fecha, tipo, categoria, monto, 1))
+    if cambios:
+        actualizar_lote_transacciones(cursor, user_id, [(id_, campos) for _, id_, campos in cambios])
+        for resultado, id_, (fecha, _, monto, tipo, categoria) in cambios:
+            anterior = anteriores[id_]
+            resultado['estado'] = 'actualizada'
+            movimientos.append((user_id, anterior['fecha'], anterior['tipo'], anterior['categoria'], anterior['monto'], -1))
+            movimientos.append((user_id, fecha, tipo, categoria, monto, 1))
+    if borrados:
+        cursor.execute(
+            "DELETE FROM transacciones WHERE user_id = %s AND id IN (" + ", ".join(["%s"] * len(borrados)) + ")",
+            [user_id, *(id_ for _, id_ in borrados)]
+        )
+        for resultado, id_ in borrados:
+            anterior = anteriores[id_]
+            resultado['estado'] = 'borrada'
+            movimientos.append((user_id, anterior['fecha'], anterior['tipo'], anterior['categoria'], anterior['monto'], -1))
+    if movimientos:
+        actualizar_agregados(cursor, movimientos)
+    conn.commit()
     cursor.close()
-    conn.close()
-    presupuestos_dict = {p['categoria']: p['monto_maximo'] for p in presupuestos_guardados}
-    return render_template('presupuestos.html', 
-                           presupuestos_guardados=presupuestos_dict
-                           )
+    return resultados, True
 
-@app.route('/configuracion', methods=['GET', 'POST'])
+@app.route('/api/transacciones/lote', methods=['POST'])
 @login_required
-def configuracion():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    user_id = current_user.id
+def lote_transacciones_api():
+    cuerpo = request.get_json(silent=True)
+    operaciones = cuerpo.get('operaciones') if isinstance(cuerpo, dict) else cuerpo
+    if not isinstance(operaciones, list) or not operaciones:
+        return jsonify({'error': 'Se espera una lista de operaciones no vacía.'}), 400
+    if len(operaciones) > LOTE_MAX_OPERACIONES:
+        return jsonify({'error': f'Máximo {LOTE_MAX_OPERACIONES} operaciones por lote.'}), 413
+    atomico = isinstance(cuerpo, dict) and cuerpo.get('atomico') is True
 
-    if request.method == 'POST':
-        categoria_nueva = request.form.get('nombre_categoria', '').strip()
-        if categoria_nueva:
-            try:
-                cursor.execute("INSERT INTO categorias (nombre, user_id) VALUES (%s, %s)", (categoria_nueva, user_id))
-                conn.commit()
-            except Exception as e:
-                conn.rollback()
-                if 'UNIQUE constraint' in str(e) or 'duplicate key' in str(e):
-                    flash(f"La categoría '{categoria_nueva}' ya existe.", 'warning')
-                else:
-                    flash(f"Error al insertar categoría: {e}", 'danger')
-        cursor.close()
+    conn = get_db_connection()
+    try:
+        resultados, aplicado = aplicar_lote_transacciones(conn, current_user.id, operaciones, atomico)
+    except Exception as e:
+        conn.rollback()
+        print(f"Error al aplicar el lote de transacciones: {e}")
+        return jsonify({'error': 'No se pudo aplicar el lote; no se guardó ninguna operación.'}), 500
+    finally:
         conn.close()
-        return redirect(url_for('configuracion'))
 
+    errores = sum(1 for r in resultados if r['estado'] == 'error')
+    return jsonify({
+        'aplicado': aplicado,
+        'aplicadas': len(resultados) - errores if aplicado else 0,
+        'errores': errores,
+        'resultados': resultados,
+    }), 200 if aplicado else 422
+
+# --- Transacciones recurrentes ---
+FRECUENCIAS_RECURRENTES = ('semanal', 'mensual', 'anual')
+
+def siguiente_fecha_recurrente(fecha, frecuencia, dia):
+    """Próxima ocurrencia después de `fecha`; `dia` es el día del mes pedido por la regla.
+
+    Un 31 cae en el último día de los meses más cortos y vuelve al 31 cuando el
+    mes lo tiene, porque se calcula siempre desde `dia` y no desde la fecha previa.
+    """
+    if frecuencia == 'semanal':
+        return fecha + datetime.timedelta(days=7)
+    ano, mes = divmod(fecha.year * 12 + fecha.month - 1 + (1 if frecuencia == 'mensual' else 12), 12)
+    mes += 1
+    return datetime.date(ano, mes, min(dia, calendar.monthrange(ano, mes)[1]))
+
+def primera_fecha_recurrente_desde(fecha, frecuencia, dia, desde):
+    """Primera ocurrencia de la regla en `desde` o después, avanzando desde `fecha`."""
+    while fecha < desde:
+        fecha = siguiente_fecha_recurrente(fecha, frecuencia, dia)
+    return fecha
+
+def insertar_transacciones_recurrentes(cursor, filas):
+    """Inserta (user_id, fecha, descripcion, monto, tipo, categoria, recurrente_id) en una sola sentencia.
+
+    Devuelve sólo las filas nuevas: las que ya existían para esa (regla, fecha)
+    las descarta el índice único, así que reintentar no duplica nada.
+    """
+    sql = ("INSERT INTO transacciones (user_id, fecha, descripcion, monto, tipo, categoria, recurrente_id) VALUES {} "
+           "ON CONFLICT (recurrente_id, fecha) DO NOTHING RETURNING user_id, fecha, tipo, categoria, monto")
+    if DATABASE_URL:
+        return psycopg2.extras.execute_values(cursor, sql.format('%s'), filas, page_size=len(filas), fetch=True)
+    cursor.execute(sql.format(", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(filas))),
+                   [valor for fila in filas for valor in fila])
+    return cursor.fetchall()
+
+def materializar_recurrentes(conn, hasta=None, user_id=None, lote=RECURRING_BATCH_SIZE):
+    """Genera las transacciones vencidas de las reglas activas hasta `hasta` (hoy por defecto).
+
+    Procesa las reglas de a `lote` y hace commit por lote junto con el avance de
+    proxima_fecha, así una corrida interrumpida retoma donde quedó.
+    """
+    hasta = hasta or datetime.date.today()
+    filtro, params = (" AND user_id = %s", (user_id,)) if user_id is not None else ("", ())
+    cursor = conn.cursor()
+    resultado = {'reglas': 0, 'creadas': 0}
+    while True:
+        cursor.execute(
+            "SELECT id, user_id, descripcion, monto, tipo, categoria, frecuencia, dia, proxima_fecha "
+            "FROM transacciones_recurrentes WHERE activa AND proxima_fecha <= %s" + filtro +
+            " ORDER BY proxima_fecha, id LIMIT %s",
+            (hasta.isoformat(), *params, lote)
+        )
+        reglas = cursor.fetchall()
+        if not reglas:
+            break
+        filas, avances = [], []
+        for regla in reglas:
+            fecha = a_fecha(regla['proxima_fecha'])
+            while fecha <= hasta:
+                filas.append((regla['user_id'], fecha.isoformat(), regla['descripcion'], regla['monto'],
+                              regla['tipo'], regla['categoria'], regla['id']))
+                fecha = siguiente_fecha_recurrente(fecha, regla['frecuencia'], regla['dia'])
+            avances.append((fecha.isoformat(), regla['id']))
+        nuevas = []
+        for i in range(0, len(filas), lote):
+            nuevas.extend(insertar_transacciones_recurrentes(cursor, filas[i:i + lote]))
+        if nuevas:
+            actualizar_agregados(cursor, [(f['user_id'], f['fecha'], f['tipo'], f['categoria'], f['monto'], 1) for f in nuevas])
+        cursor.executemany("UPDATE transacciones_recurrentes SET proxima_fecha = %s WHERE id = %s", avances)
+        conn.commit()
+        resultado['reglas'] += len(reglas)
+        resultado['creadas'] += len(nuevas)
     cursor.close()
+    return resultado
+
+@app.cli.command('materialize-recurring')
+@click.option('--hasta', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Generar hasta esta fecha (hoy por defecto).')
+@click.option('--batch-size', type=int, default=RECURRING_BATCH_SIZE, help='Reglas por lote.')
+def materialize_recurring_command(hasta, batch_size):
+    conn = get_db_connection()
+    inicio = time.perf_counter()
+    resultado = materializar_recurrentes(conn, hasta.date() if hasta else None, lote=batch_size)
     conn.close()
-    return render_template('configuracion.html')
+    click.echo(f"{resultado['creadas']} transacciones creadas de {resultado['reglas']} reglas "
+               f"en {time.perf_counter() - inicio:.1f}s.")
 
-@app.route('/configuracion/delete', methods=['POST'])
+@app.route('/configuracion/recurrentes', methods=['POST'])
 @login_required
-def delete_categoria():
-    categoria_a_borrar = request.form.get('categoria')
+def crear_recurrente():
     user_id = current_user.id
-    
-    if categoria_a_borrar == 'Otros':
-        flash("No se puede borrar la categoría 'Otros'.", 'warning')
+    try:
+        descripcion = request.form['descripcion'].strip()
+        monto = round(float(request.form['monto']), 2)
+        tipo = request.form['tipo']
+        frecuencia = request.form['frecuencia']
+        inicio = datetime.date.fromisoformat(request.form['fecha_inicio'])
+        if not descripcion or monto <= 0 or tipo not in ('ingreso', 'gasto') or frecuencia not in FRECUENCIAS_RECURRENTES:
+            raise ValueError
+    except (KeyError, ValueError):
+        flash('Datos inválidos para la transacción recurrente.', 'danger')
+        return redirect(url_for('configuracion'))
+    categoria = request.form.get('categoria', 'Otros') if tipo == 'gasto' else 'Ingreso'
+    if tipo == 'gasto' and categoria not in get_categorias_usuario(user_id):
+        flash(f"La categoría '{categoria}' no existe.", 'danger')
         return redirect(url_for('configuracion'))
-    if not categoria_a_borrar:
-         return redirect(url_for('configuracion'))
 
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("UPDATE transacciones SET categoria = 'Otros' WHERE categoria = %s AND user_id = %s",(categoria_a_borrar, user_id))
-        cursor.execute("DELETE FROM presupuestos WHERE categoria = %s AND user_id = %s",(categoria_a_borrar, user_id))
-        cursor.execute("DELETE FROM categorias WHERE nombre = %s AND user_id = %s",(categoria_a_borrar, user_id))
+        cursor.execute(
+            "INSERT INTO transacciones_recurrentes (user_id, descripcion, monto, tipo, categoria, frecuencia, dia, proxima_fecha) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+            (user_id, descripcion, monto, tipo, categoria, frecuencia, inicio.day, inicio.isoformat())
+        )
         conn.commit()
-        flash(f"Categoría '{categoria_a_borrar}' eliminada.", 'success')
+        # Las ocurrencias ya vencidas (incluida la de hoy) aparecen enseguida.
+        materializar_recurrentes(conn, user_id=user_id)
+        flash('Transacción recurrente creada.', 'success')
     except Exception as e:
         conn.rollback()
-        flash(f"Error al eliminar categoría: {e}", 'danger')
+        flash(f"Error al crear la transacción recurrente: {e}", 'danger')
     finally:
         cursor.close()
         conn.close()
-    
     return redirect(url_for('configuracion'))
 
-@app.route('/reportes')
+@app.route('/configuracion/recurrentes/<int:id>/pausar', methods=['POST'])
 @login_required
-def reportes():
-    today = datetime.date.today()
-    mes_seleccionado = request.args.get('mes', f"{today.month:02d}")
-    ano_seleccionado = request.args.get('ano', str(today.year))
-
-    nombres_meses_default = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
-    if not set_locale(): nombres_meses = nombres_meses_default
-    else:
-        try: nombres_meses = list(calendar.month_name)[1:]
-        except Exception: nombres_meses = nombres_meses_default
+def pausar_recurrente(id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT activa, frecuencia, dia, proxima_fecha FROM transacciones_recurrentes WHERE id = %s AND user_id = %s" + SQL_FOR_UPDATE,
+        (id, current_user.id)
+    )
+    regla = cursor.fetchone()
+    if regla and regla['activa']:
+        cursor.execute("UPDATE transacciones_recurrentes SET activa = FALSE WHERE id = %s", (id,))
+    elif regla:
+        # Al reanudar no se recuperan las ocurrencias del tiempo en pausa: la
+        # regla sigue desde su primera fecha de hoy en adelante.
+        proxima = primera_fecha_recurrente_desde(a_fecha(regla['proxima_fecha']), regla['frecuencia'], regla['dia'],
+                                                 datetime.date.today())
+        cursor.execute("UPDATE transacciones_recurrentes SET activa = TRUE, proxima_fecha = %s WHERE id = %s",
+                       (proxima.isoformat(), id))
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return redirect(url_for('configuracion'))
 
-    meses_del_ano = [{"val": f"{i:02d}", "nom": nombres_meses[i-1]} for i in range(1, 13)]
-    anos_disponibles = list(range(today.year - 5, today.year + 2))
+@app.route('/configuracion/recurrentes/<int:id>/editar', methods=['POST'])
+@login_required
+def editar_recurrente(id):
+    """Cambia descripción, monto, categoría y día de una regla.
 
-    return render_template('reportes.html',
-                           mes_seleccionado=mes_seleccionado,
-                           ano_seleccionado=ano_seleccionado,
-                           meses_del_ano=meses_del_ano,
-                           anos_disponibles=anos_disponibles)
+    Las transacciones ya generadas no se tocan. Si cambia el día (sólo cuenta
+    en reglas mensuales y anuales), la próxima fecha pasa a ese día dentro del
+    mismo periodo, sin quedar antes de hoy.
+    """
+    user_id = current_user.id
+    try:
+        descripcion = request.form['descripcion'].strip()
+        monto = round(float(request.form['monto']), 2)
+        dia = int(request.form['dia'])
+        if not descripcion or monto <= 0 or not 1 <= dia <= 31:
+            raise ValueError
+    except (KeyError, ValueError):
+        flash('Datos inválidos para la transacción recurrente.', 'danger')
+        return redirect(url_for('configuracion'))
 
-@app.route('/delete/<int:id>', methods=['POST'])
-@login_required
-def delete(id):
     conn = get_db_connection()
     cursor = conn.cursor()
-    user_id = current_user.id
     try:
-        cursor.execute("DELETE FROM transacciones WHERE id = %s AND user_id = %s", (id, user_id))
+        cursor.execute(
+            "SELECT tipo, categoria, frecuencia, dia, proxima_fecha FROM transacciones_recurrentes "
+            "WHERE id = %s AND user_id = %s" + SQL_FOR_UPDATE,
+            (id, user_id)
+        )
+        regla = cursor.fetchone()
+        if not regla:
+            flash("Error: No tienes permiso para editar esta regla.", 'danger')
+            return redirect(url_for('configuracion'))
+        categoria = regla['categoria']
+        if regla['tipo'] == 'gasto':
+            categoria = request.form.get('categoria', categoria)
+            if categoria not in get_categorias_usuario(user_id):
+                flash(f"La categoría '{categoria}' no existe.", 'danger')
+                return redirect(url_for('configuracion'))
+        proxima = a_fecha(regla['proxima_fecha'])
+        if regla['frecuencia'] == 'semanal':
+            dia = regla['dia']
+        elif dia != regla['dia']:
+            proxima = datetime.date(proxima.year, proxima.month, min(dia, calendar.monthrange(proxima.year, proxima.month)[1]))
+            proxima = primera_fecha_recurrente_desde(proxima, regla['frecuencia'], dia, datetime.date.today())
+        cursor.execute(
+            "UPDATE transacciones_recurrentes SET descripcion = %s, monto = %s, categoria = %s, dia = %s, proxima_fecha = %s "
+            "WHERE id = %s AND user_id = %s",
+            (descripcion, monto, categoria, dia, proxima.isoformat(), id, user_id)
+        )
         conn.commit()
+        flash('Transacción recurrente actualizada.', 'success')
     except Exception as e:
         conn.rollback()
+        flash(f"Error al editar la transacción recurrente: {e}", 'danger')
     finally:
         cursor.close()
         conn.close()
-        return redirect(request.referrer or url_for('index'))
+    return redirect(url_for('configuracion'))
 
-@app.route('/update/<int:id>', methods=['POST'])
+@app.route('/configuracion/recurrentes/<int:id>/delete', methods=['POST'])
 @login_required
-def update(id):
-    if request.method == 'POST':
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        user_id = current_user.id
-        try:
-            cursor.execute("SELECT id FROM transacciones WHERE id = %s AND user_id = %s", (id, user_id))
-            if cursor.fetchone():
-                fecha = request.form['edit-fecha']
-                descripcion = request.form['edit-descripcion']
-                monto = float(request.form['edit-monto'])
-                tipo = request.form['edit-tipo']
-                categoria = request.form.get('edit-categoria', 'Otros') if tipo == 'gasto' else 'Ingreso'
-                
-                cursor.execute(
-                    """
-                    UPDATE transacciones SET fecha = %s, descripcion = %s, monto = %s, tipo = %s, categoria = %s
-                    WHERE id = %s AND user_id = %s
-                    """,
-                    (fecha, descripcion, monto, tipo, categoria, id, user_id)
-                )
-                conn.commit()
-            else:
-                flash("Error: No tienes permiso para editar esta transacción.", 'danger')
-        except Exception as e:
-            conn.rollback()
-        finally:
-            cursor.close()
-            conn.close()
-        return redirect(request.referrer or url_for('index'))
+def delete_recurrente(id):
+    # Las transacciones ya generadas se conservan.
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM transacciones_recurrentes WHERE id = %s AND user_id = %s", (id, current_user.id))
+    conn.commit()
+    cursor.close()
+    conn.close()
+    flash('Transacción recurrente eliminada.', 'success')
+    return redirect(url_for('configuracion'))
 
+@app.route('/api/stats')
+@login_required
+def stats_api():
+    return jsonify({'pool': get_pool().stats(), 'cache': cache.stats(), 'page_cache': page_cache.stats()})
+
+def _etiqueta(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+@app.route('/metrics')
+def metrics():
+    if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+        return Response('No autorizado\n', status=401, mimetype='text/plain')
+    lineas = []
+    with metricas._lock:
+        lineas.append('# TYPE fintrack_http_requests_total counter')
+        for (endpoint, metodo, estado), n in sorted(metricas.peticiones.items()):
+            lineas.append(f'fintrack_http_requests_total{{endpoint="{_etiqueta(endpoint)}",method="{metodo}",status="{estado}"}} {n}')
+        lineas.append('# TYPE fintrack_http_request_duration_seconds histogram')
+        for endpoint, hist in sorted(metricas.latencias.items()):
+            etiqueta = _etiqueta(endpoint)
+            for limite, n in zip(BUCKETS_LATENCIA, hist['buckets']):
+                lineas.append(f'fintrack_http_request_duration_seconds_bucket{{endpoint="{etiqueta}",le="{limite}"}} {n}')
+            lineas.append(f'fintrack_http_request_duration_seconds_bucket{{endpoint="{etiqueta}",le="+Inf"}} {hist["count"]}')
+            lineas.append(f'fintrack_http_request_duration_seconds_sum{{endpoint="{etiqueta}"}} {hist["sum"]:.6f}')
+            lineas.append(f'fintrack_http_request_duration_seconds_count{{endpoint="{etiqueta}"}} {hist["count"]}')
+        lineas.append('# TYPE fintrack_http_db_seconds_total counter')
+        for endpoint, hist in sorted(metricas.latencias.items()):
+            lineas.append(f'fintrack_http_db_seconds_total{{endpoint="{_etiqueta(endpoint)}"}} {hist["db"]:.6f}')
+        lineas.append('# TYPE fintrack_http_render_seconds_total counter')
+        for endpoint, hist in sorted(metricas.latencias.items()):
+            lineas.append(f'fintrack_http_render_seconds_total{{endpoint="{_etiqueta(endpoint)}"}} {hist["render"]:.6f}')
+        lineas.append('# TYPE fintrack_http_db_queries_total counter')
+        for endpoint, hist in sorted(metricas.latencias.items()):
+            lineas.append(f'fintrack_http_db_queries_total{{endpoint="{_etiqueta(endpoint)}"}} {hist["consultas"]}')
+        lineas.append('# TYPE fintrack_db_query_calls_total counter')
+        lineas.append('# TYPE fintrack_db_query_seconds_total counter')
+        for huella, (n, segundos) in sorted(metricas.consultas.items()):
+            etiqueta = _etiqueta(huella)
+            lineas.append(f'fintrack_db_query_calls_total{{query="{etiqueta}"}} {n}')
+            lineas.append(f'fintrack_db_query_seconds_total{{query="{etiqueta}"}} {segundos:.6f}')
+        lineas.append('# TYPE fintrack_password_hash_duration_seconds histogram')
+        for operacion, hist in sorted(metricas.hashes.items()):
+            for limite, n in zip(BUCKETS_LATENCIA, hist['buckets']):
+                lineas.append(f'fintrack_password_hash_duration_seconds_bucket{{op="{operacion}",le="{limite}"}} {n}')
+            lineas.append(f'fintrack_password_hash_duration_seconds_bucket{{op="{operacion}",le="+Inf"}} {hist["count"]}')
+            lineas.append(f'fintrack_password_hash_duration_seconds_sum{{op="{operacion}"}} {hist["sum"]:.6f}')
+            lineas.append(f'fintrack_password_hash_duration_seconds_count{{op="{operacion}"}} {hist["count"]}')
+        lineas.append('# TYPE fintrack_password_hash_rejected_total counter')
+        lineas.append(f'fintrack_password_hash_rejected_total {metricas.hashes_rechazados}')
+    lineas.append('# TYPE fintrack_db_pool gauge')
+    for clave, valor in get_pool().stats().items():
+        if isinstance(valor, (int, float)):
+            lineas.append(f'fintrack_db_pool{{stat="{clave}"}} {valor}')
+    lineas.append('# TYPE fintrack_cache gauge')
+    for nombre, stats in (('datos', cache.stats()), ('paginas', page_cache.stats())):
+        for clave, valor in stats.items():
+            if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                lineas.append(f'fintrack_cache{{cache="{nombre}",stat="{clave}"}} {valor}')
+    return Response("\n".join(lineas) + "\n", mimetype='text/plain; version=0.0.4')
 
 # --- APIs de Gráficos ---
-@app.route('/api/chart-data/daily-flow')
-@login_required
-def daily_flow_chart_data():
+
+def mes_y_ano_de_la_peticion():
     mes = request.args.get('mes')
     ano = request.args.get('ano')
-    user_id = current_user.id
     if not mes or not ano:
         today = datetime.date.today()
         mes, ano = f"{today.month:02d}", str(today.year)
-    
-    date_filter_sql_where = " WHERE to_char(fecha, 'YYYY') = %s AND to_char(fecha, 'MM') = %s AND user_id = %s "
-    params = (ano, mes, user_id)
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    return mes, ano
+
+def datos_flujo_diario(cursor, user_id, ano, mes):
     cursor.execute(
-        "SELECT to_char(fecha, 'DD') as dia, tipo, SUM(monto) as total "
-        "FROM transacciones" + date_filter_sql_where +
+        "SELECT dia, tipo, SUM(total) as total "
+        "FROM resumen_diario WHERE user_id = %s AND ano = %s AND mes = %s "
         "GROUP BY dia, tipo ORDER BY dia",
-        params
+        (user_id, int(ano), int(mes))
     )
     data_db = cursor.fetchall()
-    conn.close()
     num_dias = calendar.monthrange(int(ano), int(mes))[1]
     labels = [f"{i:02d}" for i in range(1, num_dias + 1)] 
     gastos_data, ingresos_data = [0] * num_dias, [0] * num_dias
@@ -557,86 +3007,392 @@ def daily_flow_chart_data():
             gastos_data[dia_index] = float(row['total']) 
         else:
             ingresos_data[dia_index] = float(row['total']) 
-    return jsonify({'labels': labels, 'datasets': [{'label': 'Gastos', 'data': gastos_data, 'backgroundColor': '#FF6384'}, {'label': 'Ingresos', 'data': ingresos_data, 'backgroundColor': '#36A2EB'}]})
-
-@app.route('/api/chart-data/categories')
-@login_required
-def category_chart_data():
-    mes = request.args.get('mes')
-    ano = request.args.get('ano')
-    user_id = current_user.id
-    if not mes or not ano:
-        today = datetime.date.today()
-        mes, ano = f"{today.month:02d}", str(today.year)
+    return {'labels': labels, 'datasets': [{'label': 'Gastos', 'data': gastos_data, 'backgroundColor': '#FF6384'}, {'label': 'Ingresos', 'data': ingresos_data, 'backgroundColor': '#36A2EB'}]}
 
-    date_filter_sql_and = " AND to_char(fecha, 'YYYY') = %s AND to_char(fecha, 'MM') = %s AND user_id = %s "
-    params = (ano, mes, user_id)
-    
+def datos_categorias(cursor, user_id, ano, mes):
     gastos_por_categoria = []
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        # ¡CORRECCIÓN AQUÍ! HAVING SUM(monto) > 0
+        # ¡CORRECCIÓN AQUÍ! HAVING SUM(total) > 0
         cursor.execute(
-            "SELECT categoria, SUM(monto) as total "
-            "FROM transacciones "
-            "WHERE tipo = 'gasto'" + date_filter_sql_and +
-            "GROUP BY categoria HAVING SUM(monto) > 0 ORDER BY total DESC",
-            params
+            "SELECT categoria, SUM(total) as total "
+            "FROM resumen_diario "
+            "WHERE user_id = %s AND ano = %s AND mes = %s AND tipo = 'gasto' "
+            "GROUP BY categoria HAVING SUM(total) > 0 ORDER BY total DESC",
+            (user_id, int(ano), int(mes))
         )
         gastos_por_categoria = cursor.fetchall()
     except Exception as e:
         print(f"Error fetching category data: {e}")
-    finally:
-        if conn:
-            conn.close()
     
     labels = [row['categoria'] for row in gastos_por_categoria]
     data = [float(row['total']) for row in gastos_por_categoria]
-    return jsonify({'labels': labels, 'data': data})
-
-@app.route('/api/chart-data/annual-flow')
-@login_required
-def annual_flow_chart_data():
-    ano = request.args.get('ano')
-    user_id = current_user.id
-    if not ano:
-        ano = str(datetime.date.today().year)
+    return {'labels': labels, 'data': data}
 
-    nombres_meses_default = ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun', 'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
+def datos_flujo_anual(cursor, user_id, ano):
     gastos_por_mes, ingresos_por_mes = [0] * 12, [0] * 12
-    
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
+        # Gastos e ingresos de los 12 meses salen de balance_mensual en una sola lectura.
         cursor.execute(
-            "SELECT to_char(fecha, 'MM') as mes, SUM(monto) as total "
-            "FROM transacciones "
-            "WHERE tipo = 'gasto' AND to_char(fecha, 'YYYY') = %s AND user_id = %s "
-            "GROUP BY mes",
-            (ano, user_id)
+            "SELECT mes, ingresos, gastos FROM balance_mensual WHERE user_id = %s AND ano = %s",
+            (user_id, int(ano))
         )
         for row in cursor.fetchall():
-            gastos_por_mes[int(row['mes']) - 1] = float(row['total']) 
+            if row['gastos']:
+                gastos_por_mes[row['mes'] - 1] = float(row['gastos']) 
+            if row['ingresos']:
+                ingresos_por_mes[row['mes'] - 1] = float(row['ingresos']) 
+    except Exception as e:
+        print(f"Error al obtener datos anuales: {e}")
             
+    return {'labels': NOMBRES_MESES_CORTOS, 'datasets': [{'label': 'Gastos', 'data': gastos_por_mes, 'backgroundColor': '#FF6384'}, {'label': 'Ingresos', 'data': ingresos_por_mes, 'backgroundColor': '#36A2EB'}]}
+
+def respuesta_condicional(construir, *partes):
+    """Responde JSON con un ETag derivado de la versión de datos del usuario.
+
+    Si el cliente ya tiene esa versión (If-None-Match) se devuelve 304 sin
+    ejecutar ninguna consulta de agregados: sólo se lee version_datos.
+    """
+    user_id = current_user.id
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    version = leer_version_datos(cursor, user_id)
+    etag = "-".join(str(parte) for parte in (user_id, version, *partes))
+    if etag in request.if_none_match:
+        respuesta = Response(status=304)
+    else:
+        respuesta = jsonify(construir(cursor, user_id))
+    cursor.close()
+    conn.close()
+    respuesta.set_etag(etag)
+    # El navegador guarda la respuesta pero la revalida siempre con el ETag.
+    respuesta.headers['Cache-Control'] = 'private, no-cache'
+    return respuesta
+
+@app.route('/api/chart-data/daily-flow')
+@login_required
+def daily_flow_chart_data():
+    mes, ano = mes_y_ano_de_la_peticion()
+    return respuesta_condicional(lambda cursor, user_id: datos_flujo_diario(cursor, user_id, ano, mes), 'daily', ano, mes)
+
+@app.route('/api/chart-data/categories')
+@login_required
+def category_chart_data():
+    mes, ano = mes_y_ano_de_la_peticion()
+    return respuesta_condicional(lambda cursor, user_id: datos_categorias(cursor, user_id, ano, mes), 'categories', ano, mes)
+
+@app.route('/api/chart-data/annual-flow')
+@login_required
+def annual_flow_chart_data():
+    ano = request.args.get('ano') or str(datetime.date.today().year)
+    return respuesta_condicional(lambda cursor, user_id: datos_flujo_anual(cursor, user_id, ano), 'annual', ano)
+
+@app.route('/api/chart-data/resumen')
+@login_required
+def resumen_chart_data():
+    # Los tres gráficos de un (usuario, año, mes) en una sola respuesta.
+    mes, ano = mes_y_ano_de_la_peticion()
+    return respuesta_condicional(lambda cursor, user_id: {
+        'daily_flow': datos_flujo_diario(cursor, user_id, ano, mes),
+        'categories': datos_categorias(cursor, user_id, ano, mes),
+        'annual_flow': datos_flujo_anual(cursor, user_id, ano),
+    }, 'resumen', ano, mes)
+
+@app.route('/api/presupuestos/estado')
+@login_required
+def estado_presupuestos_api():
+    mes, ano = mes_y_ano_de_la_peticion()
+
+    def construir(cursor, user_id):
+        estado = leer_estado_presupuestos(cursor, user_id, ano, mes)
         cursor.execute(
-            "SELECT to_char(fecha, 'MM') as mes, SUM(monto) as total "
-            "FROM transacciones "
-            "WHERE tipo = 'ingreso' AND to_char(fecha, 'YYYY') = %s AND user_id = %s "
-            "GROUP BY mes",
-            (ano, user_id)
+            "SELECT id, mensaje, creada_en FROM notificaciones WHERE user_id = %s AND NOT leida ORDER BY id DESC LIMIT 20",
+            (user_id,)
         )
-        for row in cursor.fetchall():
-            ingresos_por_mes[int(row['mes']) - 1] = float(row['total']) 
-            
-    except Exception as e:
-        print(f"Error al obtener datos anuales: {e}")
+        notificaciones = [{'id': n['id'], 'mensaje': n['mensaje'], 'creada_en': str(n['creada_en'])} for n in cursor.fetchall()]
+        return {
+            'ano': int(ano), 'mes': int(mes),
+            'presupuestos': [
+                {**item, 'gastado': float(item['gastado']), 'presupuesto': float(item['presupuesto']),
+                 'excedido': item['presupuesto'] > 0 and item['gastado'] > item['presupuesto']}
+                for item in estado
+            ],
+            'notificaciones': notificaciones,
+        }
+    return respuesta_condicional(construir, 'presupuestos', ano, mes)
+
+# --- Analítica ---
+# El historial del usuario se lee una sola vez de resumen_diario, agrupado por
+# (mes, tipo, categoría), y se pasa a arrays de NumPy: periodo (ano*12 + mes-1),
+# monto y código de categoría. Medias móviles, variaciones, comparación
+# interanual y pronóstico se calculan sobre esos arrays en memoria en lugar de
+# lanzar un agregado SQL por gráfico. Los resultados se guardan en la caché por
+# (usuario, versión de datos), así que cualquier escritura los invalida sola.
+ANALITICA_MESES_MAX = 120
+ANALITICA_VENTANAS = (3, 6, 12)
+PRONOSTICO_MESES_MAX = 12
+
+def periodo_de(ano, mes):
+    return int(ano) * 12 + int(mes) - 1
+
+def etiqueta_periodo(periodo):
+    return f"{periodo // 12}-{periodo % 12 + 1:02d}"
+
+class HistorialMensual:
+    """Gastos por (categoría, mes) e ingresos por mes en matrices densas.
+
+    La columna 0 corresponde al periodo `inicio`; la última siempre llega al
+    menos hasta el mes en curso, aunque no haya movimientos.
+    """
+    def __init__(self, inicio, categorias, gastos, ingresos):
+        self.inicio = inicio
+        self.categorias = categorias
+        self.gastos = gastos
+        self.ingresos = ingresos
+
+    @property
+    def fin(self):
+        return self.inicio + self.ingresos.shape[0] - 1
+
+    def columnas(self, matriz, desde, cantidad):
+        # Ventana de `cantidad` meses desde `desde`, con ceros fuera del historial.
+        salida = np.zeros(matriz.shape[:-1] + (cantidad,))
+        a, b = max(desde, self.inicio), min(desde + cantidad - 1, self.fin)
+        if a <= b:
+            salida[..., a - desde:b - desde + 1] = matriz[..., a - self.inicio:b - self.inicio + 1]
+        return salida
+
+def cargar_historial(cursor, user_id, hoy=None):
+    cursor.execute(
+        "SELECT ano, mes, tipo, categoria, SUM(total) AS total FROM resumen_diario "
+        "WHERE user_id = %s GROUP BY ano, mes, tipo, categoria",
+        (user_id,)
+    )
+    filas = cursor.fetchall()
+    n = len(filas)
+    periodo = np.fromiter((f['ano'] * 12 + f['mes'] - 1 for f in filas), dtype=np.int64, count=n)
+    monto = np.fromiter((float(f['total']) for f in filas), dtype=np.float64, count=n)
+    es_gasto = np.fromiter((f['tipo'] == 'gasto' for f in filas), dtype=bool, count=n)
+    categorias, codigo = np.unique(np.array([f['categoria'] for f in filas], dtype=object)[es_gasto], return_inverse=True)
+
+    hoy = hoy or datetime.date.today()
+    actual = periodo_de(hoy.year, hoy.month)
+    inicio = int(min(periodo.min(), actual)) if n else actual
+    meses = int(max(periodo.max(), actual)) - inicio + 1 if n else 1
+    gastos = np.zeros((len(categorias), meses))
+    np.add.at(gastos, (codigo, periodo[es_gasto] - inicio), monto[es_gasto])
+    ingresos = np.bincount(periodo[~es_gasto] - inicio, weights=monto[~es_gasto], minlength=meses)
+    return HistorialMensual(inicio, [str(c) for c in categorias], gastos, ingresos)
+
+def a_lista(valores):
+    # JSON no admite NaN: los huecos (p. ej. medias sin ventana completa) van como null.
+    return [None if np.isnan(v) else round(float(v), 2) for v in valores]
+
+def media_movil(serie, ventana):
+    acumulado = np.concatenate(([0.0], np.cumsum(serie)))
+    medias = np.full(serie.shape[0], np.nan)
+    if serie.shape[0] >= ventana:
+        medias[ventana - 1:] = (acumulado[ventana:] - acumulado[:-ventana]) / ventana
+    return medias
+
+def variacion_pct(actual, anterior):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(anterior > 0, (actual - anterior) / anterior * 100, np.nan)
+
+def analitica_tendencias(historial, meses):
+    # Las medias se calculan sobre todo el historial y luego se recorta, para
+    # que el primer mes visible ya tenga su ventana completa.
+    gastos = historial.gastos.sum(axis=0)
+    desde = max(historial.fin - meses + 1, historial.inicio)
+    corte = slice(desde - historial.inicio, None)
+    return {
+        'labels': [etiqueta_periodo(p) for p in range(desde, historial.fin + 1)],
+        'gastos': a_lista(gastos[corte]),
+        'ingresos': a_lista(historial.ingresos[corte]),
+        'medias_gastos': {str(v): a_lista(media_movil(gastos, v)[corte]) for v in ANALITICA_VENTANAS},
+        'medias_ingresos': {str(v): a_lista(media_movil(historial.ingresos, v)[corte]) for v in ANALITICA_VENTANAS},
+    }
+
+def analitica_variacion_categorias(historial, ano, mes):
+    periodo = periodo_de(ano, mes)
+    anterior, actual = historial.columnas(historial.gastos, periodo - 1, 2).T
+    delta = actual - anterior
+    pct = variacion_pct(actual, anterior)
+    orden = [i for i in np.argsort(-np.abs(delta), kind='stable') if actual[i] or anterior[i]]
+    return {
+        'periodo': etiqueta_periodo(periodo),
+        'anterior': etiqueta_periodo(periodo - 1),
+        'categorias': [
+            {'categoria': historial.categorias[i], 'actual': round(float(actual[i]), 2),
+             'anterior': round(float(anterior[i]), 2), 'delta': round(float(delta[i]), 2),
+             'delta_pct': a_lista(pct[i:i + 1])[0]}
+            for i in orden
+        ],
+    }
+
+def analitica_interanual(historial, ano):
+    desde = periodo_de(ano, 1)
+    gastos = historial.columnas(historial.gastos, desde, 12)
+    gastos_antes = historial.columnas(historial.gastos, desde - 12, 12)
+    ingresos = historial.columnas(historial.ingresos, desde, 12)
+    ingresos_antes = historial.columnas(historial.ingresos, desde - 12, 12)
+    por_categoria, por_categoria_antes = gastos.sum(axis=1), gastos_antes.sum(axis=1)
+    pct_categoria = variacion_pct(por_categoria, por_categoria_antes)
+    return {
+        'labels': NOMBRES_MESES_CORTOS,
+        'ano': int(ano),
+        'gastos': a_lista(gastos.sum(axis=0)),
+        'gastos_ano_anterior': a_lista(gastos_antes.sum(axis=0)),
+        'gastos_variacion_pct': a_lista(variacion_pct(gastos.sum(axis=0), gastos_antes.sum(axis=0))),
+        'ingresos': a_lista(ingresos),
+        'ingresos_ano_anterior': a_lista(ingresos_antes),
+        'categorias': [
+            {'categoria': categoria, 'total': round(float(por_categoria[i]), 2),
+             'total_ano_anterior': round(float(por_categoria_antes[i]), 2),
+             'variacion_pct': a_lista(pct_categoria[i:i + 1])[0]}
+            for i, categoria in enumerate(historial.categorias)
+            if por_categoria[i] or por_categoria_antes[i]
+        ],
+    }
+
+def analitica_pronostico(historial, meses, hoy=None):
+    """Tendencia lineal de los gastos de los últimos 12 meses cerrados.
+
+    El mes en curso queda fuera del ajuste porque todavía está incompleto. Con
+    menos de 3 meses con gastos se usa la media simple en lugar de la recta.
+    """
+    hoy = hoy or datetime.date.today()
+    actual = periodo_de(hoy.year, hoy.month)
+    base = historial.columnas(historial.gastos, actual - 12, 12).sum(axis=0)
+    x = np.arange(12)
+    con_datos = base > 0
+    if con_datos.sum() >= 3:
+        # Sólo desde el primer mes con gastos: los meses previos al alta no son "gasto cero".
+        primero = int(np.argmax(con_datos))
+        pendiente, ordenada = np.polyfit(x[primero:], base[primero:], 1)
+        ajuste = pendiente * x[primero:] + ordenada
+        margen = float(np.std(base[primero:] - ajuste))
+    else:
+        pendiente, ordenada = 0.0, float(base[con_datos].mean()) if con_datos.any() else 0.0
+        margen = 0.0
+    futuro = np.maximum(pendiente * np.arange(12, 12 + meses) + ordenada, 0)
+    return {
+        'labels': [etiqueta_periodo(p) for p in range(actual - 12, actual)],
+        'gastos': a_lista(base),
+        'pronostico_labels': [etiqueta_periodo(p) for p in range(actual, actual + meses)],
+        'pronostico': a_lista(futuro),
+        'margen': round(margen, 2),
+        'tendencia_mensual': round(float(pendiente), 2),
+    }
+
+def analitica_memoizada(cursor, user_id, nombre, calcular, *partes):
+    # La versión de datos forma parte de la clave: al cambiar no hace falta borrar nada.
+    version = leer_version_datos(cursor, user_id)
+    clave = ":".join(str(parte) for parte in ('analitica', user_id, version, nombre, *partes))
+    return cache.get_or_set(clave, lambda: calcular(cargar_historial(cursor, user_id), *partes))
+
+def entero_de_la_peticion(nombre, defecto, maximo):
+    try:
+        return min(max(int(request.args.get(nombre, defecto)), 1), maximo)
+    except ValueError:
+        return defecto
+
+@app.route('/api/chart-data/tendencias')
+@login_required
+def tendencias_chart_data():
+    meses = entero_de_la_peticion('meses', 36, ANALITICA_MESES_MAX)
+    return respuesta_condicional(lambda cursor, user_id: analitica_memoizada(
+        cursor, user_id, 'tendencias', analitica_tendencias, meses), 'tendencias', meses)
+
+@app.route('/api/chart-data/categorias-variacion')
+@login_required
+def variacion_categorias_chart_data():
+    mes, ano = mes_y_ano_de_la_peticion()
+    return respuesta_condicional(lambda cursor, user_id: analitica_memoizada(
+        cursor, user_id, 'variacion', analitica_variacion_categorias, int(ano), int(mes)), 'variacion', ano, mes)
+
+@app.route('/api/chart-data/interanual')
+@login_required
+def interanual_chart_data():
+    ano = request.args.get('ano') or str(datetime.date.today().year)
+    return respuesta_condicional(lambda cursor, user_id: analitica_memoizada(
+        cursor, user_id, 'interanual', analitica_interanual, int(ano)), 'interanual', ano)
+
+@app.route('/api/chart-data/pronostico')
+@login_required
+def pronostico_chart_data():
+    meses = entero_de_la_peticion('meses', 3, PRONOSTICO_MESES_MAX)
+    # El pronóstico depende del mes en curso además de los datos.
+    hoy = datetime.date.today()
+    return respuesta_condicional(lambda cursor, user_id: analitica_memoizada(
+        cursor, user_id, 'pronostico', analitica_pronostico, meses, hoy), 'pronostico', meses, f"{hoy:%Y%m}")
+
+# --- APIs de Gráficos asíncronas ---
+# psycopg2 y sqlite3 son bloqueantes, así que las consultas se ejecutan en un
+# pool de hilos propio; cada una toma su conexión del pool (no la de g.db, que
+# es de la petición) para que los agregados de un gráfico corran a la vez.
+_ejecutor_graficos = ThreadPoolExecutor(max_workers=ASYNC_CHART_WORKERS, thread_name_prefix='graficos')
+
+def _consultar_con_conexion_propia(funcion, *args):
+    pool = get_pool()
+    conn = ConexionPrestada(pool.getconn(), pool, ligada_al_contexto=False)
+    cursor = conn.cursor()
+    try:
+        return funcion(cursor, *args)
     finally:
-        if conn:
-            conn.close()
-            
-    return jsonify({'labels': nombres_meses_default, 'datasets': [{'label': 'Gastos', 'data': gastos_por_mes, 'backgroundColor': '#FF6384'}, {'label': 'Ingresos', 'data': ingresos_por_mes, 'backgroundColor': '#36A2EB'}]})
+        cursor.close()
+        conn.close()
+
+async def consultar(funcion, *args):
+    # Se copia el contexto para que las consultas sigan sumando al Server-Timing de la petición.
+    contexto = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_ejecutor_graficos, contexto.run, _consultar_con_conexion_propia, funcion, *args)
+
+async def respuesta_condicional_async(consultas, armar, *partes):
+    """Igual que respuesta_condicional, con las consultas de `consultas` en paralelo.
+
+    `consultas` es una lista de (funcion, *args) que reciben (cursor, user_id, *args);
+    `armar` recibe sus resultados en el mismo orden y devuelve el JSON.
+    """
+    user_id = current_user.id
+    version = await consultar(leer_version_datos, user_id)
+    etag = "-".join(str(parte) for parte in (user_id, version, *partes))
+    if etag in request.if_none_match:
+        respuesta = Response(status=304)
+    else:
+        resultados = await asyncio.gather(*(consultar(funcion, user_id, *args) for funcion, *args in consultas))
+        respuesta = jsonify(armar(resultados))
+    respuesta.set_etag(etag)
+    respuesta.headers['Cache-Control'] = 'private, no-cache'
+    return respuesta
+
+@app.route('/api/async/chart-data/daily-flow')
+@login_required
+async def daily_flow_chart_data_async():
+    mes, ano = mes_y_ano_de_la_peticion()
+    return await respuesta_condicional_async([(datos_flujo_diario, ano, mes)], lambda r: r[0], 'daily', ano, mes)
+
+@app.route('/api/async/chart-data/categories')
+@login_required
+async def category_chart_data_async():
+    mes, ano = mes_y_ano_de_la_peticion()
+    return await respuesta_condicional_async([(datos_categorias, ano, mes)], lambda r: r[0], 'categories', ano, mes)
+
+@app.route('/api/async/chart-data/annual-flow')
+@login_required
+async def annual_flow_chart_data_async():
+    ano = request.args.get('ano') or str(datetime.date.today().year)
+    return await respuesta_condicional_async([(datos_flujo_anual, ano)], lambda r: r[0], 'annual', ano)
+
+@app.route('/api/async/chart-data/resumen')
+@login_required
+async def resumen_chart_data_async():
+    mes, ano = mes_y_ano_de_la_peticion()
+    return await respuesta_condicional_async(
+        [(datos_flujo_diario, ano, mes), (datos_categorias, ano, mes), (datos_flujo_anual, ano)],
+        lambda r: {'daily_flow': r[0], 'categories': r[1], 'annual_flow': r[2]},
+        'resumen', ano, mes
+    )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,513 @@
+"""Benchmark de las rutas de Fintrack.
+
+Siembra una base (SQLite por defecto, o la de DATABASE_URL) con N usuarios x M
+transacciones y recorre las rutas principales con el test client de Flask y,
+opcionalmente, contra un gunicorn local. Reporta p50/p95/p99, throughput y
+consultas por petición, y guarda el resultado en JSON para comparar corridas.
+
+    python benchmark.py --users 20 --transactions 5000 --output antes.json
+    python benchmark.py --users 20 --transactions 5000 --gunicorn --output despues.json
+    python benchmark.py --compare antes.json despues.json
+"""
+import argparse
+import datetime
+import http.cookiejar
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+PASSWORD = 'benchmark'
+CATEGORIAS = ['Comida', 'Transporte', 'Vivienda', 'Ocio', 'Salud', 'Ropa', 'Educación', 'Impuestos', 'Otros']
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+def resumir(latencias, consultas, duracion):
+    return {
+        'requests': len(latencias),
+        'p50_ms': round(percentil(latencias, 50) * 1000, 3),
+        'p95_ms': round(percentil(latencias, 95) * 1000, 3),
+        'p99_ms': round(percentil(latencias, 99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(latencias) * 1000, 3) if latencias else 0.0,
+        'throughput_rps': round(len(latencias) / duracion, 2) if duracion else 0.0,
+        'queries_per_request': round(statistics.fmean(consultas), 2) if consultas else 0.0,
+    }
+
+
+def consultas_de(headers):
+    coincidencia = re.search(r'db;dur=[\d.]+;desc="(\d+) consultas"', headers.get('Server-Timing', ''))
+    return int(coincidencia.group(1)) if coincidencia else 0
+
+
+def sembrar(app_module, usuarios, transacciones, rounds, semilla):
+    """Crea el esquema y los datos de prueba; devuelve los emails sembrados."""
+    rnd = random.Random(semilla)
+    hoy = datetime.date.today()
+    emails = [f"bench{i}@fintrack.local" for i in range(usuarios)]
+    password_hash = app_module.bcrypt.generate_password_hash(PASSWORD, rounds).decode('utf-8')
+
+    with app_module.app.app_context():
+        app_module.init_db_logic()
+        conn = app_module.get_db_connection()
+        cursor = conn.cursor()
+        for email in emails:
+            cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
+            if cursor.fetchone():
+                continue
+            cursor.execute("INSERT INTO users (email, password_hash) VALUES (%s, %s) RETURNING id", (email, password_hash))
+            user_id = cursor.fetchone()['id']
+            cursor.executemany("INSERT INTO categorias (nombre, user_id) VALUES (%s, %s)", [(c, user_id) for c in CATEGORIAS])
+            cursor.executemany(
+                "INSERT INTO presupuestos (categoria, monto_maximo, user_id) VALUES (%s, %s, %s)",
+                [(c, rnd.randint(50, 500) * 1000, user_id) for c in CATEGORIAS[:4]]
+            )
+            filas = []
+            for _ in range(transacciones):
+                fecha = hoy - datetime.timedelta(days=rnd.randint(0, 730))
+                if rnd.random() < 0.15:
+                    filas.append((user_id, fecha.isoformat(), 'Ingreso bench', rnd.randint(100, 2000) * 1000, 'ingreso', 'Ingreso'))
+                else:
+                    filas.append((user_id, fecha.isoformat(), f"Gasto {rnd.randint(1, 999)}", rnd.randint(1, 200) * 100, 'gasto', rnd.choice(CATEGORIAS)))
+            cursor.executemany(
+                "INSERT INTO transacciones (user_id, fecha, descripcion, monto, tipo, categoria) VALUES (%s, %s, %s, %s, %s, %s)",
+                filas
+            )
+            conn.commit()
+        app_module.reconstruir_agregados(cursor)
+        conn.commit()
+        cursor.close()
+        conn.close()
+    return emails
+
+
+def escenarios(rnd):
+    """Cada escenario es (nombre, método, ruta, formulario) generado al azar para cada petición."""
+    hoy = datetime.date.today()
+
+    def mes_ano():
+        fecha = hoy - datetime.timedelta(days=rnd.randint(0, 700))
+        return f"{fecha.month:02d}", str(fecha.year)
+
+    def filtro():
+        mes, ano = mes_ano()
+        return f"?mes={mes}&ano={ano}"
+
+    def nueva_transaccion():
+        fecha = hoy - datetime.timedelta(days=rnd.randint(0, 60))
+        return {'fecha': fecha.isoformat(), 'descripcion': 'bench', 'monto': str(rnd.randint(1, 99) * 100),
+                'tipo': 'gasto', 'categoria': rnd.choice(CATEGORIAS)}
+
+    return [
+        ('index', 'GET', lambda: '/' + filtro(), None),
+        ('reportes', 'GET', lambda: '/reportes' + filtro(), None),
+        ('daily-flow', 'GET', lambda: '/api/chart-data/daily-flow' + filtro(), None),
+        ('categories', 'GET', lambda: '/api/chart-data/categories' + filtro(), None),
+        ('annual-flow', 'GET', lambda: '/api/chart-data/annual-flow?ano=' + mes_ano()[1], None),
+        ('resumen', 'GET', lambda: '/api/chart-data/resumen' + filtro(), None),
+        ('resumen-async', 'GET', lambda: '/api/async/chart-data/resumen' + filtro(), None),
+        ('tendencias', 'GET', lambda: '/api/chart-data/tendencias?meses=36', None),
+        ('interanual', 'GET', lambda: '/api/chart-data/interanual?ano=' + mes_ano()[1], None),
+        ('pronostico', 'GET', lambda: '/api/chart-data/pronostico', None),
+        ('buscar', 'GET', lambda: f'/api/transacciones/buscar?q=gasto+{rnd.randint(1, 99)}', None),
+        ('crear', 'POST', lambda: '/', nueva_transaccion),
+    ]
+
+
+def ids_propios(client_get, ano, mes):
+    datos = json.loads(client_get(f"/api/transacciones?mes={mes}&ano={ano}&limite=50"))
+    return [t['id'] for t in datos.get('transacciones', [])]
+
+
+def correr_test_client(app_module, emails, n_requests, semilla):
+    rnd = random.Random(semilla)
+    clientes = []
+    for email in emails[:10]:
+        cliente = app_module.app.test_client()
+        cliente.post('/login', data={'email': email, 'password': PASSWORD})
+        clientes.append(cliente)
+
+    resultados = {}
+    for nombre, metodo, ruta, formulario in escenarios(rnd):
+        latencias, consultas = [], []
+        inicio_total = time.perf_counter()
+        for _ in range(n_requests):
+            cliente = rnd.choice(clientes)
+            inicio = time.perf_counter()
+            if metodo == 'GET':
+                respuesta = cliente.get(ruta())
+            else:
+                respuesta = cliente.post(ruta(), data=formulario())
+            latencias.append(time.perf_counter() - inicio)
+            consultas.append(consultas_de(respuesta.headers))
+        resultados[nombre] = resumir(latencias, consultas, time.perf_counter() - inicio_total)
+
+    # Login (bcrypt) y edición/borrado sobre filas existentes
+    latencias, consultas = [], []
+    inicio_total = time.perf_counter()
+    for _ in range(max(1, n_requests // 10)):
+        cliente = app_module.app.test_client()
+        inicio = time.perf_counter()
+        respuesta = cliente.post('/login', data={'email': rnd.choice(emails), 'password': PASSWORD})
+        latencias.append(time.perf_counter() - inicio)
+        consultas.append(consultas_de(respuesta.headers))
+    resultados['login'] = resumir(latencias, consultas, time.perf_counter() - inicio_total)
+
+    hoy = datetime.date.today()
+    for nombre in ('editar', 'borrar'):
+        latencias, consultas = [], []
+        inicio_total = time.perf_counter()
+        cliente = clientes[0]
+        ids = ids_propios(lambda ruta: cliente.get(ruta).get_data(as_text=True), hoy.year, f"{hoy.month:02d}")
+        for id_ in ids[:n_requests]:
+            inicio = time.perf_counter()
+            if nombre == 'editar':
+                respuesta = cliente.post(f'/update/{id_}', data={
+                    'edit-fecha': hoy.isoformat(), 'edit-descripcion': 'editada', 'edit-monto': '1234',
+                    'edit-tipo': 'gasto', 'edit-categoria': rnd.choice(CATEGORIAS)})
+            else:
+                respuesta = cliente.post(f'/delete/{id_}')
+            latencias.append(time.perf_counter() - inicio)
+            consultas.append(consultas_de(respuesta.headers))
+        resultados[nombre] = resumir(latencias, consultas, time.perf_counter() - inicio_total)
+    return resultados
+
+
+def analitica_sql(cursor, user_id, ano, mes, hoy):
+    """Lo mismo que calculan los endpoints de analítica, con un agregado SQL por gráfico."""
+    consultas = 0
+    cursor.execute(
+        "SELECT ano, mes, tipo, SUM(total) AS total FROM resumen_diario WHERE user_id = %s "
+        "GROUP BY ano, mes, tipo ORDER BY ano, mes", (user_id,))
+    consultas += 1
+    totales = {}
+    for fila in cursor.fetchall():
+        totales.setdefault(fila['tipo'], {})[fila['ano'] * 12 + fila['mes'] - 1] = float(fila['total'])
+    actual = hoy.year * 12 + hoy.month - 1
+    serie = [totales.get('gasto', {}).get(p, 0.0) for p in range(actual - 35, actual + 1)]
+    for ventana in (3, 6, 12):
+        [sum(serie[max(0, i - ventana + 1):i + 1]) / ventana for i in range(len(serie))]
+
+    periodo = ano * 12 + mes - 1
+    cursor.execute(
+        "SELECT categoria, "
+        "SUM(CASE WHEN ano = %s AND mes = %s THEN total ELSE 0 END) AS actual, "
+        "SUM(CASE WHEN ano = %s AND mes = %s THEN total ELSE 0 END) AS anterior "
+        "FROM resumen_diario WHERE user_id = %s AND tipo = 'gasto' GROUP BY categoria",
+        (ano, mes, (periodo - 1) // 12, (periodo - 1) % 12 + 1, user_id))
+    consultas += 1
+    cursor.fetchall()
+
+    cursor.execute(
+        "SELECT ano, mes, tipo, SUM(total) AS total FROM resumen_diario "
+        "WHERE user_id = %s AND ano IN (%s, %s) GROUP BY ano, mes, tipo", (user_id, ano, ano - 1))
+    cursor.fetchall()
+    cursor.execute(
+        "SELECT categoria, ano, SUM(total) AS total FROM resumen_diario "
+        "WHERE user_id = %s AND ano IN (%s, %s) AND tipo = 'gasto' GROUP BY categoria, ano", (user_id, ano, ano - 1))
+    cursor.fetchall()
+    consultas += 2
+
+    desde = actual - 12
+    cursor.execute(
+        "SELECT ano, mes, SUM(total) AS total FROM resumen_diario WHERE user_id = %s AND tipo = 'gasto' "
+        "AND (ano * 12 + mes - 1) BETWEEN %s AND %s GROUP BY ano, mes", (user_id, desde, actual - 1))
+    consultas += 1
+    base = [0.0] * 12
+    for fila in cursor.fetchall():
+        base[fila['ano'] * 12 + fila['mes'] - 1 - desde] = float(fila['total'])
+    media_x, media_y = 5.5, sum(base) / 12
+    pendiente = sum((x - media_x) * (y - media_y) for x, y in enumerate(base)) / sum((x - media_x) ** 2 for x in range(12))
+    [max(0.0, media_y + pendiente * (x - media_x)) for x in range(12, 15)]
+    return consultas
+
+
+def correr_analitica(app_module, emails, n_requests, semilla):
+    """Compara el motor de analítica (una lectura + NumPy) con un agregado SQL por gráfico.
+
+    Ninguno de los dos pasa por la caché: se mide el cálculo en frío.
+    """
+    rnd = random.Random(semilla)
+    hoy = datetime.date.today()
+    resultados = {}
+    with app_module.app.app_context():
+        conn = app_module.get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT id FROM users WHERE email IN ({', '.join(['%s'] * len(emails))})", emails)
+        user_ids = [fila['id'] for fila in cursor.fetchall()]
+
+        def numpy_(user_id, ano, mes):
+            historial = app_module.cargar_historial(cursor, user_id)
+            app_module.analitica_tendencias(historial, 36)
+            app_module.analitica_variacion_categorias(historial, ano, mes)
+            app_module.analitica_interanual(historial, ano)
+            app_module.analitica_pronostico(historial, 3)
+            return 1
+
+        for nombre, calcular in (('numpy', numpy_), ('sql', lambda u, a, m: analitica_sql(cursor, u, a, m, hoy))):
+            latencias, consultas = [], []
+            inicio_total = time.perf_counter()
+            for _ in range(n_requests):
+                fecha = hoy - datetime.timedelta(days=rnd.randint(0, 700))
+                inicio = time.perf_counter()
+                consultas.append(calcular(rnd.choice(user_ids), fecha.year, fecha.month))
+                latencias.append(time.perf_counter() - inicio)
+            resultados[nombre] = resumir(latencias, consultas, time.perf_counter() - inicio_total)
+        cursor.close()
+        conn.close()
+    return resultados
+
+
+def correr_lote(app_module, emails, n_transacciones, semilla, tamano_lote):
+    """Alta de n_transacciones con el formulario (una por POST) y con /api/transacciones/lote.
+
+    `throughput_rps` es por petición; `transacciones_por_segundo` permite
+    comparar ambos modos.
+    """
+    rnd = random.Random(semilla)
+    hoy = datetime.date.today()
+    cliente = app_module.app.test_client()
+    cliente.post('/login', data={'email': emails[0], 'password': PASSWORD})
+
+    def transaccion():
+        fecha = hoy - datetime.timedelta(days=rnd.randint(0, 60))
+        return {'fecha': fecha.isoformat(), 'descripcion': 'bench lote', 'monto': rnd.randint(1, 99) * 100,
+                'tipo': 'gasto', 'categoria': rnd.choice(CATEGORIAS)}
+
+    resultados = {}
+    for nombre, por_peticion, enviar in (
+        ('form', 1, lambda: cliente.post('/', data=transaccion())),
+        (f'lote-{tamano_lote}', tamano_lote, lambda: cliente.post('/api/transacciones/lote', json={
+            'operaciones': [{'op': 'crear', **transaccion()} for _ in range(tamano_lote)]})),
+    ):
+        latencias, consultas = [], []
+        inicio_total = time.perf_counter()
+        for _ in range(max(1, n_transacciones // por_peticion)):
+            inicio = time.perf_counter()
+            respuesta = enviar()
+            latencias.append(time.perf_counter() - inicio)
+            consultas.append(consultas_de(respuesta.headers))
+        duracion = time.perf_counter() - inicio_total
+        resultados[nombre] = resumir(latencias, consultas, duracion)
+        resultados[nombre]['transacciones_por_segundo'] = round(len(latencias) * por_peticion / duracion, 1)
+    return resultados
+
+
+def metadatos_con_locale(hoy):
+    """Lo que hacían index() y reportes() en cada petición antes de fijar los meses al importar."""
+    import calendar
+    import locale
+    nombres_meses = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
+    for loc in ['es_ES.UTF-8', 'es_ES', 'spanish', 'es-CL.UTF-8', 'es-CL']:
+        try:
+            locale.setlocale(locale.LC_TIME, loc)
+            nombres_meses = list(calendar.month_name)[1:]
+            break
+        except locale.Error:
+            continue
+    return [{"val": f"{i:02d}", "nom": nombres_meses[i - 1]} for i in range(1, 13)], list(range(hoy.year - 5, hoy.year + 2))
+
+
+def correr_render(app_module, n_requests, semilla):
+    """Micro-benchmark del camino de render: metadatos de meses, filtro currency y plantillas.
+
+    Mide sin base de datos: la lista de categorías se deja en g, como hace index().
+    """
+    from flask import g, render_template
+    from flask_login import login_user
+    rnd = random.Random(semilla)
+    hoy = datetime.date.today()
+    valores = [rnd.uniform(-1e7, 1e7) for _ in range(1000)]
+    moneda = app_module.format_currency_filter
+
+    def medir(funcion, repeticiones):
+        latencias = []
+        inicio_total = time.perf_counter()
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            funcion()
+            latencias.append(time.perf_counter() - inicio)
+        return resumir(latencias, [], time.perf_counter() - inicio_total)
+
+    resultados = {
+        'meses-locale': medir(lambda: metadatos_con_locale(hoy), n_requests),
+        'meses-fijos': medir(lambda: (app_module.MESES_DEL_ANO, app_module.anos_disponibles(hoy.year)), n_requests),
+        'currency-x1000': medir(lambda: [moneda(v) for v in valores], n_requests),
+    }
+    with app_module.app.test_request_context('/reportes'):
+        login_user(app_module.User(id=0, email='render@fintrack.local'))
+        g.categorias_usuario = CATEGORIAS
+        contexto = {'mes_seleccionado': f"{hoy.month:02d}", 'ano_seleccionado': str(hoy.year),
+                    'meses_del_ano': app_module.MESES_DEL_ANO, 'anos_disponibles': app_module.anos_disponibles(hoy.year)}
+        resultados['render-reportes'] = medir(lambda: render_template('reportes.html', **contexto), n_requests)
+        transacciones = [{'id': i, 'fecha': hoy, 'descripcion': f'Gasto {i}', 'monto': rnd.randint(1, 999) * 100,
+                          'tipo': 'gasto', 'categoria': rnd.choice(CATEGORIAS)} for i in range(50)]
+        resultados['render-index'] = medir(lambda: render_template(
+            'index.html', transacciones=transacciones, siguiente_cursor=None, balance_mensual=1234567,
+            ingresos_mensual=2345678, gastos_mensual=1111111, balance_historico=98765432,
+            default_form_date=hoy.isoformat(), progreso_presupuestos=[], **contexto), n_requests)
+    return resultados
+
+
+def correr_gunicorn(emails, n_requests, semilla, workers, concurrencia, puerto, env):
+    rnd = random.Random(semilla)
+    proceso = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{puerto}', 'app:app'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base = f'http://127.0.0.1:{puerto}'
+    try:
+        for _ in range(100):
+            if proceso.poll() is not None:
+                sys.exit("gunicorn terminó al arrancar (¿está instalado? pip install -r requirements.txt)")
+            try:
+                urllib.request.urlopen(base + '/login', timeout=1)
+                break
+            except OSError:
+                time.sleep(0.1)
+        else:
+            sys.exit(f"gunicorn no respondió en {base}")
+
+        abridores = []
+        for email in emails[:max(concurrencia, 1)]:
+            abridor = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+            abridor.open(base + '/login', urllib.parse.urlencode({'email': email, 'password': PASSWORD}).encode())
+            abridores.append(abridor)
+
+        def pedir(abridor, metodo, ruta, formulario):
+            datos = urllib.parse.urlencode(formulario).encode() if metodo == 'POST' else None
+            inicio = time.perf_counter()
+            with abridor.open(base + ruta, datos) as respuesta:
+                respuesta.read()
+                return time.perf_counter() - inicio, consultas_de(respuesta.headers)
+
+        resultados = {}
+        with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+            for nombre, metodo, ruta, formulario in escenarios(rnd):
+                trabajos = [(rnd.choice(abridores), metodo, ruta(), formulario() if formulario else None)
+                            for _ in range(n_requests)]
+                inicio_total = time.perf_counter()
+                medidas = list(pool.map(lambda t: pedir(*t), trabajos))
+                resultados[nombre] = resumir([m[0] for m in medidas], [m[1] for m in medidas],
+                                             time.perf_counter() - inicio_total)
+        return resultados
+    finally:
+        proceso.terminate()
+        proceso.wait(timeout=10)
+
+
+def comparar(ruta_a, ruta_b):
+    with open(ruta_a) as f:
+        a = json.load(f)
+    with open(ruta_b) as f:
+        b = json.load(f)
+    print(f"{'modo/escenario':32} {'p50 A':>9} {'p50 B':>9} {'Δ%':>7} {'p95 A':>9} {'p95 B':>9} {'Δ%':>7} {'q/req A':>8} {'q/req B':>8}")
+    for modo in sorted(set(a['results']) & set(b['results'])):
+        for escenario in sorted(set(a['results'][modo]) & set(b['results'][modo])):
+            ra, rb = a['results'][modo][escenario], b['results'][modo][escenario]
+            if 'p50_ms' not in ra or 'p50_ms' not in rb:
+                continue
+
+            def delta(clave):
+                return f"{(rb[clave] - ra[clave]) / ra[clave] * 100:+.1f}" if ra[clave] else '-'
+            print(f"{modo + '/' + escenario:32} {ra['p50_ms']:9.2f} {rb['p50_ms']:9.2f} {delta('p50_ms'):>7} "
+                  f"{ra['p95_ms']:9.2f} {rb['p95_ms']:9.2f} {delta('p95_ms'):>7} "
+                  f"{ra['queries_per_request']:8.2f} {rb['queries_per_request']:8.2f}")
+
+
+def imprimir(resultados):
+    for modo, escenarios_modo in resultados.items():
+        print(f"\n== {modo} ==")
+        print(f"{'escenario':14} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'q/req':>6}")
+        for nombre, r in escenarios_modo.items():
+            if 'p50_ms' not in r:
+                print(f"{nombre:14} {json.dumps(r)}")
+                continue
+            extra = f"  ({r['transacciones_por_segundo']:.0f} transacciones/s)" if 'transacciones_por_segundo' in r else ''
+            print(f"{nombre:14} {r['requests']:6d} {r['p50_ms']:9.2f} {r['p95_ms']:9.2f} {r['p99_ms']:9.2f} "
+                  f"{r['throughput_rps']:9.1f} {r['queries_per_request']:6.2f}{extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--transactions', type=int, default=2000, help='transacciones por usuario')
+    parser.add_argument('--requests', type=int, default=200, help='peticiones por escenario')
+    parser.add_argument('--db', help='archivo SQLite a usar (por defecto uno temporal); se ignora con DATABASE_URL')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--bcrypt-rounds', type=int, default=12)
+    parser.add_argument('--no-page-cache', action='store_true')
+    parser.add_argument('--gunicorn', action='store_true', help='además, medir contra un gunicorn local')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=100, help='operaciones por petición en el escenario de lote')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--output', help='guardar los resultados en este JSON')
+    parser.add_argument('--compare', nargs=2, metavar=('A.json', 'B.json'))
+    args = parser.parse_args()
+
+    if args.compare:
+        comparar(*args.compare)
+        return
+
+    # La configuración de app.py se lee al importarlo, así que va antes del import.
+    if not os.environ.get('DATABASE_URL'):
+        os.environ['SQLITE_PATH'] = args.db or os.path.join(tempfile.mkdtemp(prefix='fintrack-bench-'), 'bench.db')
+    # Mismo coste que el de la siembra, para que el login no dispare el rehash.
+    os.environ['BCRYPT_LOG_ROUNDS'] = str(args.bcrypt_rounds)
+    if args.no_page_cache:
+        os.environ['PAGE_CACHE_ENABLED'] = '0'
+    import app as app_module
+
+    inicio = time.perf_counter()
+    emails = sembrar(app_module, args.users, args.transactions, args.bcrypt_rounds, args.seed)
+    segundos_siembra = time.perf_counter() - inicio
+
+    resultados = {
+        'test_client': correr_test_client(app_module, emails, args.requests, args.seed),
+        'analitica': correr_analitica(app_module, emails, args.requests, args.seed),
+        'render': correr_render(app_module, args.requests, args.seed),
+        'lote': correr_lote(app_module, emails, args.requests * 10, args.seed, args.batch_size),
+    }
+    if args.gunicorn:
+        resultados['gunicorn'] = correr_gunicorn(emails, args.requests, args.seed, args.workers,
+                                                 args.concurrency, args.port, dict(os.environ))
+
+    imprimir(resultados)
+    salida = {
+        'meta': {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'backend': 'postgres' if os.environ.get('DATABASE_URL') else 'sqlite',
+            'users': args.users,
+            'transactions_per_user': args.transactions,
+            'requests_per_scenario': args.requests,
+            'batch_size': args.batch_size,
+            'seed_seconds': round(segundos_siembra, 2),
+            'page_cache': not args.no_page_cache,
+            'python': sys.version.split()[0],
+        },
+        'results': resultados,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(salida, f, indent=2)
+        print(f"\nResultados guardados en {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Fixtures comunes de la suite.
+
+Por defecto se usa una base SQLite temporal; con DATABASE_URL apuntando a una
+base vacía la misma suite corre contra Postgres. La configuración de app.py se
+lee al importarlo, así que el entorno se fija antes del primer import.
+"""
+import os
+import tempfile
+import uuid
+
+import pytest
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='fintrack-tests-'), 'tests.db')
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+
+PASSWORD = 'secreto-de-prueba'
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'lento: pruebas de volumen; se saltan salvo con FINTRACK_TESTS_LENTOS=1')
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.environ.get('FINTRACK_TESTS_LENTOS') == '1':
+        return
+    saltar = pytest.mark.skip(reason='prueba de volumen (FINTRACK_TESTS_LENTOS=1 para correrla)')
+    for item in items:
+        if 'lento' in item.keywords:
+            item.add_marker(saltar)
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app as app_module
+    app_module.app.config['TESTING'] = True
+    with app_module.app.app_context():
+        app_module.init_db_logic()
+    return app_module
+
+
+@pytest.fixture
+def usuario(app_module):
+    """Registra un usuario nuevo por la ruta real (con sus categorías por defecto)."""
+    email = f"test-{uuid.uuid4().hex[:12]}@fintrack.local"
+    app_module.app.test_client().post('/register', data={
+        'email': email, 'password': PASSWORD, 'confirm_password': PASSWORD})
+    with app_module.app.app_context():
+        conn = app_module.get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
+        user_id = cursor.fetchone()['id']
+        cursor.close()
+        conn.close()
+    return {'id': user_id, 'email': email}
+
+
+@pytest.fixture
+def cliente(app_module, usuario):
+    cliente = app_module.app.test_client()
+    cliente.post('/login', data={'email': usuario['email'], 'password': PASSWORD})
+    return cliente
+
+
+@pytest.fixture
+def cursor(app_module):
+    # Fuera de un app context a propósito: si no, las peticiones del test client
+    # compartirían su `g` (y el usuario que Flask-Login deja cacheado ahí).
+    conn = app_module.get_db_connection()
+    cursor = conn.cursor()
+    yield cursor
+    cursor.close()
+    conn.rollback()
+    conn.close()
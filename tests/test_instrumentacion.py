@@ -0,0 +1,54 @@
+import types
+
+import psycopg2.extras
+import pytest
+
+
+class CursorPsycopgFalso:
+    """Lo mínimo de un cursor psycopg2 que usan execute_values/execute_batch."""
+
+    connection = types.SimpleNamespace(encoding='UTF8')
+
+    def __init__(self):
+        self.ejecutadas = []
+
+    def mogrify(self, sql, args):
+        if isinstance(sql, bytes):
+            sql = sql.decode()
+        return (sql % tuple(repr(a) for a in args)).encode()
+
+    def execute(self, sql, *args):
+        self.ejecutadas.append(sql)
+
+    def fetchall(self):
+        return []
+
+
+def test_huella_sql_acepta_bytes(app_module):
+    assert app_module.huella_sql(b"SELECT * FROM t WHERE id = 12") == "SELECT * FROM t WHERE id = ?"
+    assert app_module.huella_sql(b"SELECT 1") == app_module.huella_sql("SELECT 1")
+
+
+def test_huella_sql_agrupa_lotes_multifila(app_module):
+    dos = app_module.huella_sql("INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)")
+    tres = app_module.huella_sql("INSERT INTO t (a, b) VALUES (1, 'x'), (2, 'y'), (3, 'z')")
+    assert dos == tres == "INSERT INTO t (a, b) VALUES (?, ...), ..."
+
+
+def test_execute_values_a_traves_del_cursor_instrumentado(app_module):
+    falso = CursorPsycopgFalso()
+    cursor = app_module.CursorInstrumentado(falso)
+    psycopg2.extras.execute_values(cursor, "INSERT INTO t (a, b) VALUES %s", [(1, 'x'), (2, 'y')], fetch=True)
+    psycopg2.extras.execute_batch(cursor, "UPDATE t SET b = %s WHERE a = %s", [('z', 1), ('w', 2)])
+
+    assert falso.ejecutadas == [b"INSERT INTO t (a, b) VALUES (1,'x'),(2,'y')",
+                                b"UPDATE t SET b = 'z' WHERE a = 1;UPDATE t SET b = 'w' WHERE a = 2"]
+    assert "INSERT INTO t (a, b) VALUES (?, ...), ..." in app_module.metricas.consultas
+
+
+def test_execute_values_en_postgres(app_module, cursor):
+    if app_module.DIALECTO != 'postgres':
+        pytest.skip('sólo con DATABASE_URL')
+    filas = psycopg2.extras.execute_values(
+        cursor, "SELECT v.column1 * 2 AS doble FROM (VALUES %s) AS v ORDER BY 1", [(1,), (2,)], fetch=True)
+    assert [f['doble'] for f in filas] == [2, 4]
@@ -0,0 +1,68 @@
+import uuid
+
+from tests.conftest import PASSWORD
+
+
+def gasto(fecha, monto, categoria='Comida', descripcion='prueba'):
+    return {'op': 'crear', 'fecha': fecha, 'descripcion': descripcion, 'monto': monto, 'tipo': 'gasto', 'categoria': categoria}
+
+
+def lote(cliente, operaciones, **extra):
+    return cliente.post('/api/transacciones/lote', json={'operaciones': operaciones, **extra})
+
+
+def test_lote_crea_actualiza_y_borra(app_module, cliente, usuario, cursor):
+    respuesta = lote(cliente, [gasto('2026-01-05', 100), gasto('2026-01-06', 200), gasto('2026-02-01', 300)])
+    assert respuesta.status_code == 200
+    ids = [r['id'] for r in respuesta.json['resultados']]
+    assert [r['estado'] for r in respuesta.json['resultados']] == ['creada'] * 3
+    assert ids == sorted(ids)
+
+    respuesta = lote(cliente, [
+        {'op': 'actualizar', 'id': ids[0], 'fecha': '2025-12-31', 'descripcion': 'editada', 'monto': 50,
+         'tipo': 'gasto', 'categoria': 'Transporte'},
+        {'op': 'borrar', 'id': ids[1]},
+        {'op': 'crear', 'fecha': '2026-01-10', 'descripcion': 'sueldo', 'monto': '1000', 'tipo': 'ingreso'},
+        gasto('2026-01-10', 10, categoria='No existe'),
+        {'op': 'borrar', 'id': ids[1]},
+    ])
+    resultados = respuesta.json['resultados']
+    assert respuesta.status_code == 200
+    assert [r['estado'] for r in resultados] == ['actualizada', 'borrada', 'creada', 'error', 'error']
+    assert respuesta.json['aplicadas'] == 3 and respuesta.json['errores'] == 2
+
+    cursor.execute("SELECT id, fecha, monto, categoria FROM transacciones WHERE user_id = %s ORDER BY id", (usuario['id'],))
+    filas = cursor.fetchall()
+    assert [f['id'] for f in filas] == [ids[0], ids[2], resultados[2]['id']]
+    assert app_module.a_fecha(filas[0]['fecha']).isoformat() == '2025-12-31'
+    assert filas[0]['categoria'] == 'Transporte'
+    assert app_module.verificar_agregados(cursor, usuario['id']) == []
+
+
+def test_lote_atomico_no_aplica_nada_si_hay_errores(app_module, cliente, usuario, cursor):
+    respuesta = lote(cliente, [gasto('2026-03-01', 100), {'op': 'borrar', 'id': 10 ** 9}], atomico=True)
+    assert respuesta.status_code == 422
+    assert [r['estado'] for r in respuesta.json['resultados']] == ['no_aplicada', 'error']
+    cursor.execute("SELECT COUNT(*) AS n FROM transacciones WHERE user_id = %s", (usuario['id'],))
+    assert cursor.fetchone()['n'] == 0
+
+
+def test_lote_no_toca_transacciones_de_otro_usuario(app_module, cliente, cursor):
+    ajeno = app_module.app.test_client()
+    email = f"ajeno-{uuid.uuid4().hex[:8]}@fintrack.local"
+    ajeno.post('/register', data={'email': email, 'password': PASSWORD, 'confirm_password': PASSWORD})
+    ajeno.post('/login', data={'email': email, 'password': PASSWORD})
+    id_ajeno = lote(ajeno, [gasto('2026-01-01', 100)]).json['resultados'][0]['id']
+
+    respuesta = lote(cliente, [{'op': 'borrar', 'id': id_ajeno},
+                               {'op': 'actualizar', 'id': id_ajeno, 'fecha': '2026-01-01', 'descripcion': 'x',
+                                'monto': 1, 'tipo': 'gasto', 'categoria': 'Comida'}])
+    assert [r['estado'] for r in respuesta.json['resultados']] == ['error', 'error']
+    cursor.execute("SELECT monto FROM transacciones WHERE id = %s", (id_ajeno,))
+    assert float(cursor.fetchone()['monto']) == 100
+
+
+def test_lote_rechaza_cuerpos_invalidos(cliente):
+    assert cliente.post('/api/transacciones/lote', json=[]).status_code == 400
+    assert cliente.post('/api/transacciones/lote', data='no es json').status_code == 400
+    assert lote(cliente, [{'op': 'borrar', 'id': 1}] * 501).status_code == 413
@@ -0,0 +1,85 @@
+import pytest
+
+
+def test_agregar_columna_es_idempotente(app_module, cursor):
+    cursor.execute("CREATE TABLE IF NOT EXISTS prueba_columnas (id INTEGER PRIMARY KEY)")
+    paso = app_module.agregar_columna('prueba_columnas', 'extra', 'INTEGER')
+    paso(cursor)
+    paso(cursor)
+    cursor.execute("INSERT INTO prueba_columnas (id, extra) VALUES (1, 2)")
+    cursor.execute("SELECT extra FROM prueba_columnas WHERE id = 1")
+    assert cursor.fetchone()['extra'] == 2
+    cursor.execute("DROP TABLE prueba_columnas")
+    cursor.connection.commit()
+
+
+def test_pasos_de_la_migracion_4_se_pueden_repetir(app_module, cursor):
+    # Reaplicar sus pasos sobre una base ya migrada no debe fallar (p. ej. tras un corte a mitad de camino).
+    pasos = next(pasos for version, _, pasos in app_module.MIGRACIONES if version == 4)
+    for paso in pasos:
+        if callable(paso) and not isinstance(paso, app_module.Indice):
+            paso(cursor)
+        elif isinstance(paso, str):
+            cursor.execute(paso)
+    cursor.connection.commit()
+
+
+def tabla_existe(app_module, cursor, tabla):
+    if app_module.DIALECTO == 'postgres':
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL AS existe", (tabla,))
+        return bool(cursor.fetchone()['existe'])
+    cursor.execute("SELECT COUNT(*) AS n FROM sqlite_master WHERE type = 'table' AND name = %s", (tabla,))
+    return cursor.fetchone()['n'] > 0
+
+
+def borrar_prueba(app_module, conn, tabla, version):
+    cursor = conn.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {tabla}")
+    cursor.execute("DELETE FROM schema_version WHERE version = %s", (version,))
+    conn.commit()
+    cursor.close()
+
+
+def test_migracion_fallida_no_deja_pasos_a_medias(app_module, monkeypatch, cursor):
+    monkeypatch.setattr(app_module, 'MIGRACIONES', [
+        (999, 'Prueba atómica', ["CREATE TABLE prueba_atomica (id INTEGER)", "SELECT * FROM tabla_que_no_existe"]),
+    ])
+    conn = app_module.get_db_connection()
+    try:
+        with pytest.raises(Exception):
+            app_module.aplicar_migraciones(conn, log=lambda mensaje: None)
+        assert not tabla_existe(app_module, cursor, 'prueba_atomica')
+        assert 999 not in app_module.versiones_aplicadas(cursor)
+    finally:
+        borrar_prueba(app_module, conn, 'prueba_atomica', 999)
+        conn.close()
+
+
+def test_indices_pendientes_se_retoman_sin_repetir_los_pasos(app_module, monkeypatch, cursor):
+    if app_module.DIALECTO != 'postgres':
+        pytest.skip('los índices CONCURRENTLY sólo existen en Postgres')
+    monkeypatch.setattr(app_module, 'MIGRACIONES', [
+        # Sin IF NOT EXISTS a propósito: repetir el paso fallaría.
+        (998, 'Prueba índices', ["CREATE TABLE prueba_indices (id INTEGER)",
+                                 app_module.Indice('idx_prueba_indices', 'prueba_indices', 'id')]),
+    ])
+    crear_indice = app_module._crear_indice_concurrente
+
+    def falla(conn, indice):
+        raise RuntimeError('corte durante la construcción del índice')
+
+    conn = app_module.get_db_connection()
+    try:
+        monkeypatch.setattr(app_module, '_crear_indice_concurrente', falla)
+        with pytest.raises(RuntimeError):
+            app_module.aplicar_migraciones(conn, log=lambda mensaje: None)
+        assert not app_module.versiones_aplicadas(cursor)[998]['completa']
+
+        monkeypatch.setattr(app_module, '_crear_indice_concurrente', crear_indice)
+        assert app_module.aplicar_migraciones(conn, log=lambda mensaje: None) == [998]
+        assert app_module.versiones_aplicadas(cursor)[998]['completa']
+        cursor.execute("SELECT to_regclass('idx_prueba_indices') IS NOT NULL AS existe")
+        assert cursor.fetchone()['existe']
+    finally:
+        borrar_prueba(app_module, conn, 'prueba_indices', 998)
+        conn.close()
@@ -0,0 +1,66 @@
+import datetime
+
+
+def crear_regla(cliente, **campos):
+    datos = {'descripcion': 'Arriendo', 'monto': '1000', 'tipo': 'gasto', 'categoria': 'Ocio',
+             'frecuencia': 'mensual', 'fecha_inicio': (datetime.date.today() + datetime.timedelta(days=40)).isoformat()}
+    datos.update(campos)
+    return cliente.post('/configuracion/recurrentes', data=datos)
+
+
+def reglas_de(cursor, user_id):
+    cursor.execute("SELECT * FROM transacciones_recurrentes WHERE user_id = %s ORDER BY id", (user_id,))
+    return cursor.fetchall()
+
+
+def test_fusionar_y_borrar_categoria_actualizan_las_reglas(cliente, usuario, cursor):
+    crear_regla(cliente, categoria='Ocio')
+    crear_regla(cliente, categoria='Salud')
+    cliente.post('/configuracion/fusionar', data={'origenes': ['Ocio'], 'destino': 'Entretenimiento'})
+    cliente.post('/configuracion/delete', data={'categoria': 'Salud'})
+    assert [r['categoria'] for r in reglas_de(cursor, usuario['id'])] == ['Entretenimiento', 'Otros']
+
+
+def test_crear_regla_valida_la_categoria(cliente, usuario, cursor):
+    crear_regla(cliente, categoria='No existe')
+    assert reglas_de(cursor, usuario['id']) == []
+
+
+def test_reanudar_no_recupera_las_ocurrencias_en_pausa(app_module, cliente, usuario, cursor):
+    crear_regla(cliente, frecuencia='semanal')
+    regla = reglas_de(cursor, usuario['id'])[0]
+    cliente.post(f"/configuracion/recurrentes/{regla['id']}/pausar")
+    # La regla quedó pausada varios meses.
+    cursor.execute("UPDATE transacciones_recurrentes SET proxima_fecha = %s WHERE id = %s",
+                   ((datetime.date.today() - datetime.timedelta(days=100)).isoformat(), regla['id']))
+    cursor.connection.commit()
+
+    cliente.post(f"/configuracion/recurrentes/{regla['id']}/pausar")
+    regla = reglas_de(cursor, usuario['id'])[0]
+    proxima = app_module.a_fecha(regla['proxima_fecha'])
+    assert regla['activa']
+    assert datetime.date.today() <= proxima < datetime.date.today() + datetime.timedelta(days=7)
+
+    app_module.materializar_recurrentes(cursor.connection, user_id=usuario['id'])
+    cursor.execute("SELECT COUNT(*) AS n FROM transacciones WHERE user_id = %s", (usuario['id'],))
+    assert cursor.fetchone()['n'] == (1 if proxima == datetime.date.today() else 0)
+
+
+def url_editar(regla):
+    return f"/configuracion/recurrentes/{regla['id']}/editar"
+
+
+def test_editar_regla(app_module, cliente, usuario, cursor):
+    inicio = datetime.date.today() + datetime.timedelta(days=40)
+    crear_regla(cliente, fecha_inicio=inicio.isoformat())
+    regla = reglas_de(cursor, usuario['id'])[0]
+    assert url_editar(regla) in cliente.get('/configuracion').get_data(as_text=True)
+    cliente.post(f"/configuracion/recurrentes/{regla['id']}/editar",
+                 data={'descripcion': 'Arriendo nuevo', 'monto': '1250.5', 'dia': '1', 'categoria': 'Salud'})
+    regla = reglas_de(cursor, usuario['id'])[0]
+    assert (regla['descripcion'], float(regla['monto']), regla['categoria'], regla['dia']) == ('Arriendo nuevo', 1250.5, 'Salud', 1)
+    assert app_module.a_fecha(regla['proxima_fecha']) == inicio.replace(day=1)
+
+    cliente.post(f"/configuracion/recurrentes/{regla['id']}/editar",
+                 data={'descripcion': 'x', 'monto': '10', 'dia': '1', 'categoria': 'No existe'})
+    assert reglas_de(cursor, usuario['id'])[0]['categoria'] == 'Salud'